@@ -1,11 +1,12 @@
 from __future__ import absolute_import
 from __future__ import print_function
+import bz2
+import gzip
+import json
 import os
 import shutil
 import tarfile
-import tempfile
 from contextlib import contextmanager
-from operator import attrgetter
 
 try:
     cmp = cmp       # Python 2
@@ -14,10 +15,18 @@ except NameError:
         return (a > b) - (a < b)
 
 __all__ = [
+    'ArchiveIndex',
     'SGF',
+    'find_archives',
     'find_sgfs',
 ]
 
+_BZIP2_MAGIC = b'BZh'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+# Suffixes of compressed archives, whose uncompressed copy is named like the archive with the suffix replaced by .tar.
+_COMPRESSED_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tbz', '.tar.xz', '.txz')
+_ARCHIVE_INDEXES = {}
+
 
 class SafetyError(Exception):
     pass
@@ -75,52 +84,225 @@ class TarballSGFLocator(SGFLocator):
         return '%s:%s' % (self.tarball_path, self.archive_filename)
 
     def contents(self):
-        return tarfile.open(self.tarball_path).extractfile(self.archive_filename).read()
+        return ArchiveIndex.cached(self.tarball_path).read(self.archive_filename)
 
 
-def find_sgfs(path):
-    """Find all SGFs in a directory or archive."""
-    print(('Examining %s...' % (path,)))
+class ArchiveIndex(object):
+    """Names, byte offsets and sizes of all members of a tar archive, in archive order.
+
+    Offsets point into the uncompressed tar stream. With an uncompressed copy of
+    the archive next to it (or an uncompressed archive), any member is read with
+    a single seek instead of scanning the archive. The index is stored as JSON
+    next to the archive, so it is only built once. Members that aren't regular
+    files have no size.
+    """
+    def __init__(self, archive_path, names, offsets, sizes):
+        self.archive_path = archive_path
+        self.names = list(names)
+        self.offsets = list(offsets)
+        self.sizes = list(sizes)
+        self._members = dict((name, i) for i, name in enumerate(self.names))
+        self._data_path = self.uncompressed_path(archive_path)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def index_path(archive_path):
+        return archive_path + '.index.json'
+
+    @staticmethod
+    def copy_path(archive_path):
+        """Path of the uncompressed copy of a compressed archive, see uncompress, or None without a known suffix."""
+        for suffix in _COMPRESSED_SUFFIXES:
+            if archive_path.endswith(suffix):
+                return archive_path[:-len(suffix)] + '.tar'
+        return None
+
+    @classmethod
+    def uncompressed_path(cls, archive_path):
+        """Path of the uncompressed tar data of an archive, or None if there is none."""
+        if _is_uncompressed_tar(archive_path):
+            return archive_path
+        copy_path = cls.copy_path(archive_path)
+        if copy_path is not None and os.path.isfile(copy_path):
+            return copy_path
+        return None
+
+    @classmethod
+    def build(cls, archive_path):
+        """Index an archive, reading it once from start to end."""
+        names, offsets, sizes = [], [], []
+        data_path = cls.uncompressed_path(archive_path)
+        # Uncompressed data is indexed by seeking from header to header, otherwise the archive is streamed.
+        with tarfile.open(data_path or archive_path, mode='r:' if data_path else 'r|*') as tf:
+            for tf_entry in tf:
+                names.append(tf_entry.name)
+                offsets.append(tf_entry.offset_data)
+                sizes.append(tf_entry.size if tf_entry.isfile() else None)
+        return cls(archive_path, names, offsets, sizes)
+
+    @classmethod
+    def load(cls, archive_path):
+        """Load the stored index of an archive, building and storing it if it is missing or outdated."""
+        index_path = cls.index_path(archive_path)
+        if os.path.isfile(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(archive_path):
+            with open(index_path) as index_file:
+                serialized = json.load(index_file)
+            return cls(archive_path, serialized['names'], serialized['offsets'], serialized['sizes'])
+        archive_index = cls.build(archive_path)
+        try:
+            archive_index.store()
+        except (IOError, OSError):
+            # Read-only corpus, the index is rebuilt next time.
+            pass
+        return archive_index
+
+    def store(self):
+        with open(self.index_path(self.archive_path), 'w') as index_file:
+            json.dump({'names': self.names, 'offsets': self.offsets, 'sizes': self.sizes}, index_file)
+
+    def uncompress(self):
+        """Write an uncompressed copy next to a compressed archive, so members can be read with a seek.
+
+        Archives whose name has none of the known compressed suffixes are
+        left alone, since their copy couldn't be found again.
+        """
+        copy_path = self.copy_path(self.archive_path)
+        if self._data_path is not None or copy_path is None:
+            return
+        with _open_compressed(self.archive_path) as compressed, open(copy_path + '.tmp', 'wb') as copy:
+            shutil.copyfileobj(compressed, copy)
+        os.rename(copy_path + '.tmp', copy_path)
+        self._data_path = copy_path
+
+    @classmethod
+    def cached(cls, archive_path):
+        """The index of an archive, loaded once per process."""
+        if archive_path not in _ARCHIVE_INDEXES:
+            _ARCHIVE_INDEXES[archive_path] = cls.load(archive_path)
+        return _ARCHIVE_INDEXES[archive_path]
+
+    def sgf_names(self):
+        """Names of the SGF files in the archive, sorted by name like the games of a CorpusIndex."""
+        return sorted(name for name, size in zip(self.names, self.sizes)
+                      if size is not None and name.endswith('.sgf'))
+
+    @property
+    def random_access(self):
+        """Whether there is uncompressed tar data, so members can be read in any order at no extra cost."""
+        return self._data_path is not None
+
+    def open(self):
+        """Open the uncompressed tar data for reading members, see read.
+
+        Without an uncompressed copy, this decompresses the archive on the
+        fly: seeking forward skips through the stream, seeking backward
+        starts over, so read members in archive order.
+        """
+        if self._data_path is None:
+            return _open_compressed(self.archive_path)
+        return open(self._data_path, 'rb')
+
+    def read(self, name, data_file=None):
+        """Contents of the named member, from data_file as returned by open, or a newly opened one."""
+        if data_file is None:
+            with self.open() as data_file:
+                return self.read(name, data_file)
+        member = self._members[name]
+        data_file.seek(self.offsets[member])
+        return data_file.read(self.sizes[member])
+
+    def read_members(self, names, data_file):
+        """Contents of the named members by name, read in archive order so data_file only seeks forward."""
+        # Offsets grow with the position of a member in the archive.
+        members = sorted(self._members[name] for name in names)
+        return dict((self.names[member], self.read(self.names[member], data_file)) for member in members)
+
+
+def _is_uncompressed_tar(path):
+    try:
+        with tarfile.open(path, mode='r:'):
+            return True
+    except tarfile.ReadError:
+        return False
+
+
+def _open_compressed(archive_path):
+    """Open a compressed archive as a file of its uncompressed tar data.
+
+    Data is decompressed on the fly: seeking forward skips through the
+    stream, seeking backward starts over.
+    """
+    with open(archive_path, 'rb') as archive:
+        magic = archive.read(len(_XZ_MAGIC))
+    if magic.startswith(_BZIP2_MAGIC):
+        return bz2.BZ2File(archive_path, 'rb')
+    if magic.startswith(_XZ_MAGIC):
+        import lzma  # Python 3 only, like xz support in tarfile.
+        return lzma.open(archive_path, 'rb')
+    return gzip.open(archive_path, 'rb')
+
+
+def find_archives(path):
+    """Find all SGF archives in a directory, or the archive itself, in the order find_sgfs visits them."""
     if os.path.isdir(path):
-        return _walk_dir(path)
-    if tarfile.is_tarfile(path):
-        return _walk_tarball(path)
+        children = os.listdir(path)
+        children.sort()
+        copies = set(ArchiveIndex.copy_path(child) for child in children)
+        for child in children:
+            if child in copies:
+                # Uncompressed copy of an archive, see ArchiveIndex.uncompress.
+                continue
+            for archive_path in find_archives(os.path.join(path, child)):
+                yield archive_path
+    elif tarfile.is_tarfile(path):
+        yield path
 
 
-def _walk_dir(path):
-    children = os.listdir(path)
-    children.sort()
-    for child in children:
-        full_path = os.path.join(path, child)
-        for sgf in find_sgfs(full_path):
+def find_sgfs(path):
+    """Find all SGFs in a directory or archive."""
+    for archive_path in find_archives(path):
+        print(('Examining %s...' % (archive_path,)))
+        for sgf in _walk_tarball(archive_path):
             yield sgf
 
 
+def _name_is_safe(filename):
+    # Check for unsafe filenames. Theoretically a tarball can contain
+    # absolute filenames, or names like '../../whatever'. Nothing is
+    # extracted, but such archives are still rejected.
+    root = os.path.join(os.sep, 'tarball', '')
+    final_path = os.path.normpath(os.path.join(root, filename))
+    return os.path.commonprefix([final_path, root]) == root
+
+
 @contextmanager
 def tarball_iterator(tarball_path):
-    tempdir = tempfile.mkdtemp(prefix='tmp-betago')
-    tf = tarfile.open(tarball_path)
+    """Iterate over the SGFs of a tarball, in archive order.
 
-    # Check for unsafe filenames. Theoretically a tarball can contain
-    # absolute filenames, or names like '../../whatever'
-    def name_is_safe(filename):
-        final_path = os.path.realpath(os.path.join(tempdir, filename))
-        dir_to_check = os.path.join(os.path.realpath(tempdir), '')
-        return os.path.commonprefix([final_path, dir_to_check]) == dir_to_check
-    if not all(name_is_safe(tf_entry.name) for tf_entry in tf):
-        raise SafetyError('Tarball %s contains unsafe filenames' % (tarball_path,))
-    sgf_names = [tf_entry.name for tf_entry in tf
-                 if tf_entry.isfile and tf_entry.name.endswith('.sgf')]
-    sgf_names.sort()
-    tf.extractall(tempdir)
+    The archive (or its uncompressed copy) is streamed once from start
+    to end and games are read one at a time, as the iterator advances,
+    so neither the archive nor all of its games are ever held on disk
+    or in memory. Callers that need the games sorted by name should
+    sort what they keep of them, not reread the archive in that order.
+    Raises SafetyError on reaching a member with an unsafe name.
+    """
+    tf = tarfile.open(ArchiveIndex.uncompressed_path(tarball_path) or tarball_path, mode='r|*')
     try:
-        yield [SGF(SGFLocator(tarball_path, sgf_name), open(os.path.join(tempdir, sgf_name)).read())
-               for sgf_name in sgf_names]
+        yield _stream_sgfs(tarball_path, tf)
     finally:
-        shutil.rmtree(tempdir)
         tf.close()
 
 
+def _stream_sgfs(tarball_path, tf):
+    for tf_entry in tf:
+        if not _name_is_safe(tf_entry.name):
+            raise SafetyError('Tarball %s contains unsafe filenames' % (tarball_path,))
+        if tf_entry.isfile() and tf_entry.name.endswith('.sgf'):
+            yield SGF(SGFLocator(tarball_path, tf_entry.name), tf.extractfile(tf_entry).read())
+
+
 def _walk_tarball(path):
     with tarball_iterator(path) as tarball:
         for sgf in tarball:
@@ -1,17 +1,21 @@
 from __future__ import absolute_import
 from __future__ import print_function
-import copy
+import bisect
+import functools
 import itertools
 import json
+import multiprocessing
+import re
 
-from .archive import SGFLocator, find_sgfs, tarball_iterator
+from .archive import SGF, ArchiveIndex, SGFLocator, find_archives, tarball_iterator
 from ..dataloader.goboard import GoBoard
-from ..gosgf import Sgf_game
-from six.moves import range
+from ..gosgf import Sgf_game, sgf_properties
+from six.moves import range, zip
 
 __all__ = [
     'CorpusIndex',
     'build_index',
+    'count_moves',
     'load_index',
     'store_index',
 ]
@@ -34,6 +38,89 @@ def _sequence(game_record):
     return seq
 
 
+# Games CorpusIndex reads from a compressed archive at a time, see _generate_games.
+_READ_BATCH_SIZE = 256
+
+# Where the parser starts reading a game.
+_START_RE = re.compile(br'\(\s*;')
+# SGF property values, with escaped characters.
+_VALUE = br'\[[^\\\]]*(?:\\.[^\\\]]*)*\]'
+# A game tree without variations, i.e. '(', one or more nodes and ')'.
+_SIMPLE_GAME_RE = re.compile(br'\(\s*(?:;(?:\s*[A-Z]{1,8}(?:\s*' + _VALUE + br')+)*\s*)+\)', re.DOTALL)
+# The start of a node, or the identifier and first value of a property.
+_TOKEN_RE = re.compile(br'(;)|([A-Z]{1,8})\s*\[([^\\\]]*(?:\\.[^\\\]]*)*)\](?:\s*' + _VALUE + br')*', re.DOTALL)
+# Raw values of the points of a board, by board size.
+_BOARD_POINTS = {}
+
+
+def _board_points(size):
+    if size not in _BOARD_POINTS:
+        letters = [bytes(bytearray([ord('a') + i])) for i in range(size)]
+        _BOARD_POINTS[size] = frozenset(col + row for col in letters for row in letters)
+    return _BOARD_POINTS[size]
+
+
+def _parsed_move_count(sgf_contents):
+    try:
+        return len(_sequence(Sgf_game.from_string(sgf_contents)))
+    except ValueError:
+        return 0
+
+
+def count_moves(sgf_contents):
+    """Count the moves of the main sequence of an SGF game.
+
+    A lightweight stand-in for len(_sequence(game_record)) that doesn't
+    build the game record: for a game without variations, as KGS writes
+    them, it reads the move of every node straight off the SGF data,
+    with B taking precedence over W like in Tree_node.get_move. Other
+    games are parsed. Games the parser rejects count 0, since
+    CorpusIndex skips them.
+    """
+    if not isinstance(sgf_contents, bytes):
+        sgf_contents = sgf_contents.encode('utf-8')
+    start = _START_RE.search(sgf_contents)
+    game = _SIMPLE_GAME_RE.match(sgf_contents, start.start()) if start is not None else None
+    if game is None:
+        return _parsed_move_count(sgf_contents)
+
+    root, moves = {}, []
+    black = white = None
+    num_nodes = 0
+    for node, identifier, value in _TOKEN_RE.findall(game.group()):
+        if node:
+            moves.append(white if black is None else black)
+            black = white = None
+            num_nodes += 1
+        elif identifier == b'B':
+            black = value if black is None else black
+        elif identifier == b'W':
+            white = value if white is None else white
+        elif num_nodes == 1:
+            root.setdefault(identifier, value)
+    moves.append(white if black is None else black)
+
+    # Reject what Sgf_game and Tree_node.get_move would reject.
+    try:
+        size = int(root.get(b'SZ', 19))
+        if b'CA' in root:
+            sgf_properties.normalise_charset_name(root[b'CA'])
+    except (LookupError, ValueError):
+        return 0
+    if not 1 <= size <= 26:
+        return 0
+    points = _board_points(size)
+    passes = (b'', b'tt') if size <= 19 else (b'',)
+    num_moves = 0
+    for move in moves:
+        if move is None or move in passes:
+            continue
+        if move not in points:
+            return 0
+        num_moves += 1
+    return num_moves
+
+
 class CorpusIndex(object):
     def __init__(self, physical_files, chunk_size, boundaries):
         self.physical_files = list(sorted(physical_files))
@@ -60,43 +147,65 @@ class CorpusIndex(object):
 
     def get_chunk(self, chunk_number):
         assert 0 <= chunk_number < self.num_chunks
-        chunk_start = self.boundaries[chunk_number]
-        iterator = iter(self._generate_examples(chunk_start.locator))
-        # Skip to the appropriate move in the current game.
-        for _ in range(chunk_start.position):
-            next(iterator)
-        return itertools.islice(iterator, self.chunk_size)
+        return itertools.islice(self._generate_examples(self.boundaries[chunk_number]), self.chunk_size)
 
     def _generate_examples(self, start):
         """
+        Yields (board, color, move) for every move from start on. The
+        board is the same object throughout a game and is advanced in
+        place, so consume each example before asking for the next one,
+        or copy the board if it must outlive that.
+
+        The first game is found through the archive index, and the moves
+        before the start position are played without yielding them, so
+        the work to get to the start doesn't depend on where it is.
+
         Args:
-            start (SGFLocator)
+            start (Pointer)
         """
-        start_file_idx = self.physical_files.index(start.physical_file)
+        start_file_idx = self.physical_files.index(start.locator.physical_file)
         for physical_file in self.physical_files[start_file_idx:]:
-            for sgf in self._generate_games(physical_file):
-                if sgf.locator < start:
-                    continue
-                board = GoBoard(19)
+            start_game = None
+            if physical_file == start.locator.physical_file:
+                start_game = start.locator.game_file
+            for sgf in self._generate_games(physical_file, start_game):
+                skip = start.position if sgf.locator.game_file == start_game else 0
+                board = GoBoard(19, feature_planes=True)
                 try:
                     game_record = Sgf_game.from_string(sgf.contents)
                     # Set up the handicap.
-                    if game_record.get_handicap() > 0:
+                    if game_record.get_handicap():
                         for setup in game_record.get_root().get_setup_stones():
                             for move in setup:
                                 board.apply_move('b', move)
                     for i, (color, move) in enumerate(_sequence(game_record)):
-                        yield copy.deepcopy(board), color, move
+                        if i >= skip:
+                            yield board, color, move
                         if move is not None:
                             board.apply_move(color, move)
                 except ValueError:
                     print(("Invalid SGF data, skipping game record %s" % (sgf,)))
                     print(("Board was:\n%s" % (board,)))
 
-    def _generate_games(self, physical_file):
-        with tarball_iterator(physical_file) as tarball:
-            for sgf in tarball:
-                yield sgf
+    def _generate_games(self, physical_file, start_game=None):
+        """
+        Yields the games of a physical file in index order, from
+        start_game on, reading each straight from its offset in the
+        archive. Without an uncompressed copy every backward seek
+        starts decompressing over, so games are then read in batches of
+        _READ_BATCH_SIZE, each in archive order, and yielded in index
+        order.
+        """
+        archive_index = ArchiveIndex.cached(physical_file)
+        sgf_names = archive_index.sgf_names()
+        first = bisect.bisect_left(sgf_names, start_game) if start_game is not None else 0
+        batch_size = 1 if archive_index.random_access else _READ_BATCH_SIZE
+        with archive_index.open() as data_file:
+            for batch_start in range(first, len(sgf_names), batch_size):
+                batch = sgf_names[batch_start:batch_start + batch_size]
+                contents = archive_index.read_members(batch, data_file)
+                for sgf_name in batch:
+                    yield SGF(SGFLocator(physical_file, sgf_name), contents[sgf_name])
 
 
 class Pointer(object):
@@ -122,30 +231,56 @@ class Pointer(object):
         )
 
 
-def build_index(path, chunk_size):
+def _count_archive_moves(physical_file, uncompress=False):
+    """(game file, number of positions) of every SGF in an archive, sorted by game file.
+
+    With uncompress, an uncompressed copy of the archive is written
+    first, see ArchiveIndex.uncompress.
+    """
+    if uncompress:
+        ArchiveIndex.cached(physical_file).uncompress()
+    with tarball_iterator(physical_file) as tarball:
+        return sorted((sgf.locator.game_file, count_moves(sgf.contents)) for sgf in tarball)
+
+
+def build_index(path, chunk_size, num_workers=None, uncompress=False):
     """Index all SGF files found in the given location.
 
     This will include SGF that are contained inside zip or tar archives.
+    Archives are counted in parallel by num_workers processes, one per
+    CPU by default. With uncompress, an uncompressed copy is written
+    next to every gzipped archive along the way, so get_chunk can jump
+    straight to any game instead of decompressing up to it.
     """
-    physical_files = set()
+    physical_files = list(find_archives(path))
+    count_archive_moves = functools.partial(_count_archive_moves, uncompress=uncompress)
+    if num_workers == 1 or len(physical_files) < 2:
+        game_counts = [count_archive_moves(physical_file) for physical_file in physical_files]
+    else:
+        pool = multiprocessing.Pool(processes=num_workers)
+        try:
+            game_counts = pool.map(count_archive_moves, physical_files)
+        finally:
+            pool.close()
+            pool.join()
+
     boundaries = []
     examples_needed = 0
-    for sgf in find_sgfs(path):
-        physical_files.add(sgf.locator.physical_file)
-        if examples_needed == 0:
-            # The start of this SGF is a chunk boundary.
-            boundaries.append(Pointer(sgf.locator, 0))
-            examples_needed = chunk_size
-        game_record = Sgf_game.from_string(sgf.contents)
-        num_positions = len(_sequence(game_record))
-        if examples_needed < num_positions:
-            # The start of the next chunk is inside this SGF.
-            boundaries.append(Pointer(sgf.locator, examples_needed))
-            remaining_examples = num_positions - examples_needed
-            examples_needed = chunk_size - remaining_examples
-        else:
-            # This SGF is entirely contained within the current chunk.
-            examples_needed -= num_positions
+    for physical_file, games in zip(physical_files, game_counts):
+        for game_file, num_positions in games:
+            locator = SGFLocator(physical_file, game_file)
+            if examples_needed == 0:
+                # The start of this SGF is a chunk boundary.
+                boundaries.append(Pointer(locator, 0))
+                examples_needed = chunk_size
+            if examples_needed < num_positions:
+                # The start of the next chunk is inside this SGF.
+                boundaries.append(Pointer(locator, examples_needed))
+                remaining_examples = num_positions - examples_needed
+                examples_needed = chunk_size - remaining_examples
+            else:
+                # This SGF is entirely contained within the current chunk.
+                examples_needed -= num_positions
 
     return CorpusIndex(physical_files, chunk_size, boundaries)
 
@@ -0,0 +1,361 @@
+from __future__ import absolute_import
+from array import array
+
+import numpy as np
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+from six.moves import range
+
+__all__ = [
+    'ArrayGoBoard',
+    'ArrayGoString',
+    'neighbor_table',
+]
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+BORDER = 3
+
+_COLOR_CODES = {'b': BLACK, 'w': WHITE}
+_COLOR_NAMES = {BLACK: 'b', WHITE: 'w'}
+
+_NEIGHBOR_TABLES = {}
+
+
+def neighbor_table(board_size):
+    '''
+    Return a list mapping every padded point index of a board with the given size to the tuple of its four
+    neighbours, in the order (row - 1), (row + 1), (col - 1), (col + 1). Border points map to an empty tuple.
+    Tables are built once per board size and shared between boards.
+    '''
+    table = _NEIGHBOR_TABLES.get(board_size)
+    if table is None:
+        width = board_size + 2
+        table = [()] * (width * width)
+        for row in range(board_size):
+            for col in range(board_size):
+                point = (row + 1) * width + col + 1
+                table[point] = (point - width, point + width, point - 1, point + 1)
+        _NEIGHBOR_TABLES[board_size] = table
+    return table
+
+
+class PointSet(set):
+    '''
+    Set of padded point indices. Offers size() so it can stand in for a BoardSequence.
+    '''
+    __slots__ = ()
+
+    def size(self):
+        return len(self)
+
+
+class ArrayGoString(object):
+    '''
+    A string of contiguous stones on an ArrayGoBoard. Stones and liberties are sets of padded point indices,
+    the accessors mirror those of betago.dataloader.goboard.GoString.
+    '''
+    __slots__ = ('color', 'stones', 'liberties')
+
+    def __init__(self, color, stones, liberties):
+        self.color = color
+        self.stones = PointSet(stones)
+        self.liberties = PointSet(liberties)
+
+    def __deepcopy__(self, memo):
+        # Points are plain ints, so copying the sets is enough.
+        return ArrayGoString(self.color, self.stones, self.liberties)
+
+    def get_num_stones(self):
+        return len(self.stones)
+
+    def get_num_liberties(self):
+        return len(self.liberties)
+
+    def __str__(self):
+        return 'array_go_string[ color=%s stones=%s liberties=%s ]' % (
+            self.color, sorted(self.stones), sorted(self.liberties))
+
+
+class _BoardView(Mapping):
+    '''
+    Read-only mapping from (row, col) to 'b' or 'w' for every stone on an ArrayGoBoard, standing in for
+    the GoBoard.board dictionary.
+    '''
+    __slots__ = ('_go_board',)
+
+    def __init__(self, go_board):
+        self._go_board = go_board
+
+    def get(self, pos, default=None):
+        point = self._go_board.point_index(pos)
+        if point is None:
+            return default
+        return _COLOR_NAMES.get(self._go_board.points[point], default)
+
+    def __getitem__(self, pos):
+        color = self.get(pos)
+        if color is None:
+            raise KeyError(pos)
+        return color
+
+    def __contains__(self, pos):
+        return self.get(pos) is not None
+
+    def __iter__(self):
+        go_board = self._go_board
+        points = go_board.points
+        for point in range(len(points)):
+            if points[point] == BLACK or points[point] == WHITE:
+                yield go_board.point_position(point)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _GoStringView(_BoardView):
+    '''
+    Read-only mapping from (row, col) to the ArrayGoString containing that stone, standing in for the
+    GoBoard.go_strings dictionary.
+    '''
+    __slots__ = ()
+
+    def get(self, pos, default=None):
+        point = self._go_board.point_index(pos)
+        if point is None:
+            return default
+        go_string = self._go_board.strings[point]
+        return default if go_string is None else go_string
+
+
+class ArrayGoBoard(object):
+    '''
+    Go board backed by a flat array of point colors. Points are addressed by padded 1-D indices, i.e. the board
+    is surrounded by a ring of BORDER points, so neighbours never need bounds checks and can be read from a
+    precomputed table. Offers the same public interface as GoBoard (apply_move, is_move_legal, is_simple_ko,
+    board and go_strings), so it can be used as a drop-in replacement.
+
+    Playing moves is about two to three times as fast as on GoBoard, see examples/benchmark_boards.py. BoardBatch
+    is built on it. The data processors keep GoBoard with feature_planes=True instead, which updates the feature
+    planes move by move and so turns out several times faster per processed position than reading them off an
+    ArrayGoBoard.
+    '''
+    __slots__ = ('board_size', 'width', 'points', 'strings', 'neighbors', 'ko_last_move_num_captured',
+                 'ko_last_move', 'board', 'go_strings')
+
+    def __init__(self, board_size=19):
+        '''
+        Parameters
+        ----------
+        board_size: Side length of the board, defaulting to 19.
+        points: Array of EMPTY, BLACK, WHITE or BORDER codes, one per padded point.
+        strings: List holding the ArrayGoString of every occupied point, None elsewhere.
+        ko_last_move_num_captured: How many stones have been captured last move. If this is not 1, it can't be ko.
+        ko_last_move: board position of the ko.
+        '''
+        self.board_size = board_size
+        self.width = board_size + 2
+        self.points = array('b', [BORDER] * (self.width * self.width))
+        for row in range(board_size):
+            for col in range(board_size):
+                self.points[(row + 1) * self.width + col + 1] = EMPTY
+        self.strings = [None] * len(self.points)
+        self.neighbors = neighbor_table(board_size)
+        self.ko_last_move_num_captured = 0
+        self.ko_last_move = None
+        self.board = _BoardView(self)
+        self.go_strings = _GoStringView(self)
+
+    def point_index(self, pos):
+        '''Padded point index of a (row, col) position, or None if it is off the board.'''
+        row, col = pos
+        if 0 <= row < self.board_size and 0 <= col < self.board_size:
+            return (row + 1) * self.width + col + 1
+        return None
+
+    def point_position(self, point):
+        '''(row, col) position of a padded point index.'''
+        row, col = divmod(point, self.width)
+        return row - 1, col - 1
+
+    def other_color(self, color):
+        '''
+        Color of other player
+        '''
+        if color == 'b':
+            return 'w'
+        if color == 'w':
+            return 'b'
+
+    def is_move_on_board(self, move):
+        return move in self.board
+
+    def is_move_suicide(self, color, pos):
+        '''
+        Check if a proposed move would be suicide. A move is fine if it touches an empty point, connects to one
+        of our strings that keeps another liberty, or takes the last liberty of an enemy string.
+        '''
+        code = _COLOR_CODES[color]
+        for neighbor in self.neighbors[self.point_index(pos)]:
+            neighbor_color = self.points[neighbor]
+            if neighbor_color == EMPTY:
+                return False
+            if neighbor_color == BORDER:
+                continue
+            num_liberties = len(self.strings[neighbor].liberties)
+            if neighbor_color == code:
+                if num_liberties > 1:
+                    return False
+            elif num_liberties == 1:
+                return False
+        return True
+
+    def is_move_legal(self, color, pos):
+        '''Check if a proposed moved is legal.'''
+        point = self.point_index(pos)
+        return point is not None and self.points[point] == EMPTY and \
+            (not self.is_move_suicide(color, pos)) and \
+            (not self.is_simple_ko(color, pos))
+
+    def legal_moves_mask(self, color):
+        '''
+        Boolean array of shape (board_size, board_size) marking every point where color may legally play, i.e.
+        empty points that are neither suicide nor simple ko. Same semantics as GoBoard.legal_moves_mask, read
+        straight off the padded point array.
+        '''
+        code = _COLOR_CODES[color]
+        points = np.frombuffer(self.points, dtype=np.int8).reshape(self.width, self.width)
+        empty = points == EMPTY
+        # Stones a new stone can safely touch: ours with another liberty, or theirs about to be captured.
+        safe = empty.copy()
+        safe_flat = safe.reshape(-1)
+        for go_string in set(go_string for go_string in self.strings if go_string is not None):
+            num_liberties = len(go_string.liberties)
+            if (num_liberties > 1) if _COLOR_CODES[go_string.color] == code else (num_liberties == 1):
+                safe_flat[list(go_string.stones)] = True
+        legal = empty[1:-1, 1:-1] & (safe[:-2, 1:-1] | safe[2:, 1:-1] | safe[1:-1, :-2] | safe[1:-1, 2:])
+
+        # Only the neighbours of the last move can be a simple ko.
+        if self.ko_last_move_num_captured == 1:
+            for neighbor in self.neighbors[self.point_index(self.ko_last_move)]:
+                if self.points[neighbor] == EMPTY:
+                    pos = self.point_position(neighbor)
+                    if self.is_simple_ko(color, pos):
+                        legal[pos] = False
+        return legal
+
+    def is_simple_ko(self, play_color, pos):
+        '''
+        Determine ko from board position and player.
+
+        Parameters:
+        -----------
+        play_color: Color of the player to make the next move.
+        pos: Current move as (row, col)
+        '''
+        if self.ko_last_move_num_captured != 1:
+            return False
+        row, col = pos
+        last_move_row, last_move_col = self.ko_last_move
+        if abs(last_move_row - row) + abs(last_move_col - col) != 1:
+            return False
+        last_go_string = self.strings[self.point_index(self.ko_last_move)]
+        if last_go_string is None or len(last_go_string.liberties) != 1 or len(last_go_string.stones) != 1:
+            return False
+        point = self.point_index(pos)
+        if point is None:
+            return False
+        enemy_code = _COLOR_CODES[self.other_color(play_color)]
+        num_adjacent_enemy_liberties = 0
+        for neighbor in self.neighbors[point]:
+            if self.points[neighbor] == enemy_code and len(self.strings[neighbor].liberties) == 1:
+                num_adjacent_enemy_liberties += 1
+        return num_adjacent_enemy_liberties == 1
+
+    def apply_move(self, play_color, pos):
+        '''
+        Execute move for given color, i.e. play current stone on this board
+        Parameters:
+        -----------
+        play_color: Color of player about to move
+        pos: Current move as (row, col)
+        '''
+        point = self.point_index(pos)
+        if point is None:
+            raise ValueError('Move ' + str(pos) + ' is not on the board.')
+        points = self.points
+        strings = self.strings
+        if points[point] != EMPTY:
+            raise ValueError('Move ' + str(pos) + ' is already on board.')
+
+        code = _COLOR_CODES[play_color]
+        enemy_code = BLACK + WHITE - code
+        neighbors = self.neighbors[point]
+        self.ko_last_move_num_captured = 0
+
+        # Remove any enemy stones that no longer have a liberty
+        for neighbor in neighbors:
+            if points[neighbor] == enemy_code:
+                enemy_string = strings[neighbor]
+                enemy_string.liberties.discard(point)
+                if not enemy_string.liberties:
+                    self._remove_string(enemy_string)
+
+        # Create a string for our new stone, and merge with any adjacent strings
+        points[point] = code
+        play_string = ArrayGoString(play_color, (point,), ())
+        strings[point] = play_string
+        for neighbor in neighbors:
+            neighbor_color = points[neighbor]
+            if neighbor_color == EMPTY:
+                play_string.liberties.add(neighbor)
+            elif neighbor_color == code and strings[neighbor] is not play_string:
+                play_string = self._merge_strings(play_string, strings[neighbor])
+        play_string.liberties.discard(point)
+
+        # Store last move for ko
+        self.ko_last_move = pos
+
+    def _merge_strings(self, first, second):
+        '''Merge the smaller of two strings into the larger one and return the result.'''
+        if len(first.stones) < len(second.stones):
+            first, second = second, first
+        strings = self.strings
+        for stone in second.stones:
+            strings[stone] = first
+        first.stones |= second.stones
+        first.liberties |= second.liberties
+        return first
+
+    def _remove_string(self, go_string):
+        '''Take a captured string off the board and hand its points back as liberties to adjacent strings.'''
+        points = self.points
+        strings = self.strings
+        for stone in go_string.stones:
+            points[stone] = EMPTY
+            strings[stone] = None
+        self.ko_last_move_num_captured += len(go_string.stones)
+        for stone in go_string.stones:
+            for neighbor in self.neighbors[stone]:
+                neighbor_string = strings[neighbor]
+                if neighbor_string is not None:
+                    neighbor_string.liberties.add(stone)
+
+    def __str__(self):
+        result = 'ArrayGoBoard\n'
+        for i in range(self.board_size - 1, -1, -1):
+            line = ''
+            for j in range(0, self.board_size):
+                thispiece = self.board.get((i, j))
+                if thispiece is None:
+                    line = line + '.'
+                if thispiece == 'b':
+                    line = line + '*'
+                if thispiece == 'w':
+                    line = line + 'O'
+            result = result + line + '\n'
+        return result
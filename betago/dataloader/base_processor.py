@@ -8,18 +8,29 @@ import gc
 import glob
 import os.path
 import tarfile
-import gzip
+import json
 import shutil
 import numpy as np
 import argparse
+import collections
 import multiprocessing
 from os import sys
-from keras.utils import np_utils
+from six.moves import range, zip
 
 from .. import gosgf
+from ..corpora.archive import ArchiveIndex
 from .goboard import GoBoard
 from .index_processor import KGSIndex
 from .sampling import Sampler
+from .encoding import FEATURE_DTYPE, model_input
+from .shards import ShardWriter, ShardedDataset
+from .symmetry import NUM_SYMMETRIES, transform_labels, transform_planes
+
+
+# Consolidation copies .dat bodies in pieces of this size, so memory use doesn't grow with the files.
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+# Examples per feature and label file written by GoDataProcessor.process_zip.
+CHUNK_SIZE = 1024
 
 
 def worker(jobinfo):
@@ -31,11 +42,33 @@ def worker(jobinfo):
 
 
 class DataGenerator(object):
-    def __init__(self, data_dir, samples):
+    def __init__(self, data_dir, samples, sparse_labels=False, augment=None, seed=None):
+        '''
+        Parameters:
+        -----------
+        data_dir: Folder holding the feature and label files written by process_zip.
+        samples: List of (zip file name, game index) pairs to generate data for.
+        sparse_labels: If True, yield move indices instead of one-hot labels.
+        augment: None to yield positions as stored, 'random' to rotate or reflect every batch by a random
+                 board symmetry, or 'all' to yield every batch under all eight symmetries.
+        seed: Seed for the random symmetries.
+        '''
+        if augment not in (None, 'random', 'all'):
+            raise ValueError('Unknown augmentation ' + str(augment))
         self.data_dir = data_dir
         self.files = set(file_name for file_name, index in samples)
         self.samples = samples
         self.num_samples = None
+        self.sparse_labels = sparse_labels
+        self.augment = augment
+        self.rng = np.random.RandomState(seed)
+
+    def _symmetries(self):
+        if self.augment == 'all':
+            return range(NUM_SYMMETRIES)
+        if self.augment == 'random':
+            return [self.rng.randint(NUM_SYMMETRIES)]
+        return [0]
 
     def get_num_samples(self, batch_size=128, nb_classes=19 * 19):
         if self.num_samples is not None:
@@ -54,14 +87,15 @@ class DataGenerator(object):
                 label_file = feature_file.replace('features', 'labels')
                 X = np.load(feature_file)
                 y = np.load(label_file)
-                X = X.astype('float32')
-                y = np_utils.to_categorical(y.astype(int), nb_classes)
                 gc.collect()
                 while X.shape[0] >= batch_size:
                     X_batch, X = X[:batch_size], X[batch_size:]
                     y_batch, y = y[:batch_size], y[batch_size:]
                     gc.collect()
-                    yield X_batch, y_batch
+                    for symmetry in self._symmetries():
+                        # Rotated planes are views, the only copy is the float conversion for the model.
+                        yield model_input(transform_planes(X_batch, symmetry), transform_labels(y_batch, symmetry),
+                                          nb_classes, self.sparse_labels)
             gc.collect()
 
     def generate(self, batch_size=128, nb_classes=19 * 19):
@@ -227,42 +261,52 @@ class GoBaseProcessor(object):
             pool.join()
             sys.exit(-1)
 
+    def sampled_games(self, dir_name, zip_file_name, game_list):
+        '''
+        Yield the SGF contents of the games in game_list, indices into the members of a KGS archive after its
+        folder entry, in archive order and as often as they are sampled. With an uncompressed copy of the archive
+        in dir_name, each game is read with a single seek through the archive's member index. Otherwise the
+        gzipped archive is streamed once, so nothing is decompressed to disk and only the sampled games are read
+        into memory.
+        '''
+        archive_path = dir_name + '/' + zip_file_name
+        if ArchiveIndex.uncompressed_path(archive_path) is not None:
+            archive_index = ArchiveIndex.load(archive_path)
+            for index in sorted(game_list):
+                name = archive_index.names[index + 1]
+                if not name.endswith('.sgf'):
+                    raise ValueError(name + ' is not a valid sgf')
+                yield archive_index.read(name)
+            return
+
+        samples_by_member = collections.Counter(index + 1 for index in game_list)
+        last_member = max(samples_by_member) if samples_by_member else -1
+        with tarfile.open(archive_path, mode='r|gz') as this_zip:
+            for member_number, member in enumerate(this_zip):
+                if member_number in samples_by_member:
+                    if not member.name.endswith('.sgf'):
+                        raise ValueError(member.name + ' is not a valid sgf')
+                    sgf_content = this_zip.extractfile(member).read()
+                    for _ in range(samples_by_member[member_number]):
+                        yield sgf_content
+                if member_number == last_member:
+                    break
+
     def init_go_board(self, sgf_contents):
         ''' Initialize a 19x19 go board from SGF file content'''
         sgf = gosgf.Sgf_game.from_string(sgf_contents)
-        return sgf, GoBoard(19)
-
-    def num_total_examples(self, this_zip, game_list, name_list):
-        ''' Total number of moves, i.e. training samples'''
-        total_examples = 0
-        for index in game_list:
-            name = name_list[index + 1]
-            if name.endswith('.sgf'):
-                content = this_zip.extractfile(name).read()
-                sgf, go_board_no_handy = self.init_go_board(content)
-                go_board, first_move_done = self.get_handicap(go_board_no_handy, sgf)
-
-                num_moves = 0
-                for item in sgf.main_sequence_iter():
-                    color, move = item.get_move()
-                    if color is not None and move is not None:
-                        if first_move_done:
-                            num_moves = num_moves + 1
-                        first_move_done = True
-                total_examples = total_examples + num_moves
-            else:
-                raise ValueError(name + ' is not a valid sgf')
-        return total_examples
+        return sgf, GoBoard(19, feature_planes=True)
 
 
 class GoDataProcessor(GoBaseProcessor):
     '''
     GoDataProcessor generates data, e.g. numpy arrays, of features and labels and returns them to the user.
     '''
-    def __init__(self, data_directory='data', num_planes=7, consolidate=True, use_generator=False):
+    def __init__(self, data_directory='data', num_planes=7, consolidate=True, use_generator=False, augment=None):
         super(GoDataProcessor, self).__init__(data_directory=data_directory,
                                               num_planes=num_planes, consolidate=consolidate)
         self.use_generator = use_generator
+        self.augment = augment
 
     def feature_and_label(self, color, move, go_board):
         '''
@@ -273,107 +317,84 @@ class GoDataProcessor(GoBaseProcessor):
         '''
         return NotImplemented
 
+    def fill_features(self, color, go_board, out):
+        '''
+        Write the features of the current board situation, as seen by color, into out, a zero-filled array of
+        shape (num_planes, 19, 19). Processors override this to skip the array feature_and_label allocates.
+        '''
+        out[...] = self.feature_and_label(color, (0, 0), go_board, self.num_planes)[0]
+
+    def features_for_positions(self, boards, colors, dtype=FEATURE_DTYPE, out=None):
+        '''
+        Features of many positions, written straight into one array of shape (N, num_planes, 19, 19).
+
+        Parameters:
+        -----------
+        boards: Boards to process, any iterable. Each board is processed before the next one is drawn, so a
+                generator advancing a single board in place works as well.
+        colors: Color of the next person to move on each board, consumed in lockstep with boards.
+        dtype: Data type of the array to allocate.
+        out: Zero-filled array of shape (N, num_planes, 19, 19) to write into instead. Required if boards has no
+             length.
+
+        return: X - features of the positions processed, a view of the first rows of out
+        '''
+        if out is None:
+            out = np.zeros((len(boards), self.num_planes, 19, 19), dtype=dtype)
+        num_positions = 0
+        for go_board, color in zip(boards, colors):
+            self.fill_features(color, go_board, out[num_positions])
+            num_positions += 1
+        return out[:num_positions]
+
     def process_zip(self, dir_name, zip_file_name, data_file_name, game_list):
-        # Read zipped file and extract name list
-        this_gz = gzip.open(dir_name + '/' + zip_file_name)
-        this_tar_file = zip_file_name[0:-3]
-        this_tar = open(dir_name + '/' + this_tar_file, 'wb')
-        shutil.copyfileobj(this_gz, this_tar)  # random access needed to tar
-        this_tar.close()
-        this_zip = tarfile.open(dir_name + '/' + this_tar_file)
-        name_list = this_zip.getnames()
-
-        # Determine number of examples
-        total_examples = self.num_total_examples(this_zip, game_list, name_list)
-
-        features = np.zeros((total_examples, self.num_planes, 19, 19))
-        labels = np.zeros((total_examples,))
-
-        counter = 0
-        for index in game_list:
-            name = name_list[index + 1]
-            if name.endswith('.sgf'):
-                '''
-                Load Go board and determine handicap of game, then iterate through all moves,
-                store preprocessed move in data_file and apply move to board.
-                '''
-                sgf_content = this_zip.extractfile(name).read()
-                sgf, go_board_no_handy = self.init_go_board(sgf_content)
-                go_board, first_move_done = self.get_handicap(go_board_no_handy, sgf)
-                for item in sgf.main_sequence_iter():
-                    color, move = item.get_move()
-                    if color is not None and move is not None:
-                        row, col = move
-                        if first_move_done:
-                            X, y = self.feature_and_label(color, move, go_board, self.num_planes)
-                            features[counter] = X
-                            labels[counter] = y
-                            counter += 1
-                        go_board.apply_move(color, (row, col))
-                        first_move_done = True
-            else:
-                raise ValueError(name + ' is not a valid sgf')
-
-        feature_file_base = dir_name + '/' + data_file_name + '_features_%d'
-        label_file_base = dir_name + '/' + data_file_name + '_labels_%d'
-
-        # Due to files with large content, split up after chunksize
-        chunk = 0
-        chunksize = 1024
-        while features.shape[0] >= chunksize:
-            feature_file = feature_file_base % chunk
-            label_file = label_file_base % chunk
-            chunk += 1
-            cur_features, features = features[:chunksize], features[chunksize:]
-            cur_labels, labels = labels[:chunksize], labels[chunksize:]
-            np.save(feature_file, cur_features)
-            np.save(label_file, cur_labels)
+        # Positions go straight into fixed-size shard buffers, which are saved as they fill up. The SGF files are
+        # parsed only once, and the last, partial shard is written as well.
+        writer = ShardWriter(dir_name, data_file_name, (self.num_planes, 19, 19), shard_size=CHUNK_SIZE)
+        for sgf_content in self.sampled_games(dir_name, zip_file_name, game_list):
+            '''
+            Load Go board and determine handicap of game, then iterate through all moves,
+            store preprocessed move in data_file and apply move to board.
+            '''
+            sgf, go_board_no_handy = self.init_go_board(sgf_content)
+            go_board, first_move_done = self.get_handicap(go_board_no_handy, sgf)
+            for item in sgf.main_sequence_iter():
+                color, move = item.get_move()
+                if color is not None and move is not None:
+                    row, col = move
+                    if first_move_done:
+                        self.fill_features(color, go_board, writer.add(row * 19 + col))
+                    go_board.apply_move(color, (row, col))
+                    first_move_done = True
+        writer.close()
 
     def consolidate_games(self, name, samples):
         print('>>> Creating consolidated numpy arrays')
 
         if self.use_generator:
             print('>>> Return generator')
-            generator = DataGenerator(self.data_dir, samples)
+            generator = DataGenerator(self.data_dir, samples, augment=self.augment)
             return generator
 
         files_needed = set(file_name for file_name, index in samples)
         print('>>> Total number of files: ' + str(len(files_needed)))
 
-        file_names = []
-        for zip_file_name in files_needed:
-            file_name = zip_file_name.replace('.tar.gz', '') + name
-            file_names.append(file_name)
-
-        feature_list = []
-        label_list = []
-        print(file_names)
-        for file_name in file_names:
-            file_prefix = file_name.replace('.tar.gz', '')
+        # Examples are copied shard by shard into a sharded dataset, so at most one shard and the file being read
+        # are held in memory, instead of concatenating everything in one array.
+        writer = ShardWriter(self.data_dir, str(self.num_planes) + '_plane_' + name, (self.num_planes, 19, 19))
+        for zip_file_name in sorted(files_needed):
+            file_prefix = zip_file_name.replace('.tar.gz', '') + name
             feature_base = self.data_dir + '/' + file_prefix + '_features_*.npy'
             print(feature_base)
-            for feature_file in glob.glob(feature_base):
+            for feature_file in sorted(glob.glob(feature_base)):
                 print(feature_file)
-                X = np.load(feature_file)
-                feature_list.append(X)
-            label_base = self.data_dir + '/' + file_prefix + '_labels_*.npy'
-            print(label_base)
-            for label_file in glob.glob(label_base):
-                print(label_file)
-                y = np.load(label_file)
-                label_list.append(y)
-        print('>>> Done')
-
-        features = np.concatenate(feature_list, axis=0)
-        labels = np.concatenate(label_list, axis=0)
+                label_file = feature_file.replace('_features_', '_labels_')
+                writer.append(np.load(feature_file, mmap_mode='r'), np.load(label_file, mmap_mode='r'))
+        manifest_path = writer.close()
+        print('>>> Done, %d examples in %d shards' % (writer.num_examples, len(writer.shards)))
 
-        feature_file = self.data_dir + '/' + str(self.num_planes) + '_plane_features_' + name
-        label_file = self.data_dir + '/' + str(self.num_planes) + '_plane_labels_' + name
-
-        np.save(feature_file, features)
-        np.save(label_file, labels)
-
-        return features, labels
+        dataset = ShardedDataset(manifest_path)
+        return dataset.features, dataset.labels
 
 
 class GoFileProcessor(GoBaseProcessor):
@@ -401,51 +422,38 @@ class GoFileProcessor(GoBaseProcessor):
         print(headerLine)
         headerLine = headerLine + "\0\n"
         headerLine = headerLine + chr(0) * (1024 - len(headerLine))
-        data_file.write(headerLine)
+        data_file.write(headerLine.encode('ascii'))
 
     def process_zip(self, dir_name, zip_file_name, data_file_name, game_list):
-        # Read zipped file and extract name list
-        this_gz = gzip.open(dir_name + '/' + zip_file_name)
-        this_tar_file = zip_file_name[0:-3]
-        this_tar = open(dir_name + '/' + this_tar_file, 'wb')
-        shutil.copyfileobj(this_gz, this_tar)  # random access needed to tar
-        this_tar.close()
-        this_zip = tarfile.open(dir_name + '/' + this_tar_file)
-        name_list = this_zip.getnames()
-
-        # Determine number of examples
-        total_examples = self.num_total_examples(this_zip, game_list, name_list)
-        print('>>> Total number of Go games in this zip: ' + str(total_examples))
-
-        # Write file header
+        # The number of examples is only known once all games are processed, so the header is written again at
+        # the end. This way the archive is streamed and every game parsed just once.
         data_file = open(dir_name + '/' + data_file_name, 'wb')
-        self.write_file_header(data_file=data_file, n=total_examples, num_planes=7, board_size=19, bits_per_pixel=1)
+        self.write_file_header(data_file=data_file, n=0, num_planes=7, board_size=19, bits_per_pixel=1)
 
         # Write body and close file
-        for index in game_list:
-            name = name_list[index + 1]
-            if name.endswith('.sgf'):
-                '''
-                Load Go board and determine handicap of game, then iterate through all moves,
-                store preprocessed move in data_file and apply move to board.
-                '''
-                sgf_content = this_zip.extractfile(name).read()
-                sgf, go_board_no_handy = self.init_go_board(sgf_content)
-                go_board, first_move_done = self.get_handicap(go_board_no_handy, sgf)
-                move_idx = 0
-                for item in sgf.main_sequence_iter():
-                    (color, move) = item.get_move()
-                    if color is not None and move is not None:
-                        row, col = move
-                        if first_move_done:
-                            self.store_results(data_file, color, move, go_board)
-                        go_board.apply_move(color, (row, col))
-                        move_idx = move_idx + 1
-                        first_move_done = True
-            else:
-                raise ValueError(name + ' is not a valid sgf')
-        data_file.write('END')
+        total_examples = 0
+        for sgf_content in self.sampled_games(dir_name, zip_file_name, game_list):
+            '''
+            Load Go board and determine handicap of game, then iterate through all moves,
+            store preprocessed move in data_file and apply move to board.
+            '''
+            sgf, go_board_no_handy = self.init_go_board(sgf_content)
+            go_board, first_move_done = self.get_handicap(go_board_no_handy, sgf)
+            for item in sgf.main_sequence_iter():
+                (color, move) = item.get_move()
+                if color is not None and move is not None:
+                    row, col = move
+                    if first_move_done:
+                        self.store_results(data_file, color, move, go_board)
+                        total_examples += 1
+                    go_board.apply_move(color, (row, col))
+                    first_move_done = True
+        data_file.write(b'END')
+        print('>>> Total number of Go games in this zip: ' + str(total_examples))
+        data_file.seek(0)
+        self.write_file_header(data_file=data_file, n=total_examples, num_planes=7, board_size=19, bits_per_pixel=1)
         data_file.close()
+        self.write_manifest(dir_name + '/' + data_file_name, total_examples)
 
     def consolidate_games(self, name, samples):
         print('>>> Creating consolidated .dat...')
@@ -469,24 +477,36 @@ class GoFileProcessor(GoBaseProcessor):
             if not os.path.isfile(self.data_dir + '/' + data_file_name):
                 print('>>> Missing file: ' + data_file_name)
                 sys.exit(-1)
-            child = open(self.data_dir + '/' + data_file_name, 'rb')
-            header = child.read(1024)
-            this_n = int(header.split('-n=')[1].split('-')[0])
-            child.close()
-            num_records = num_records + this_n
+            num_records = num_records + self.read_num_records(self.data_dir + '/' + data_file_name)
 
-        # Write content to consolidate file
+        # Stream the body of every file into the consolidated file, minus its END marker
         consolidated_file = open(file_path, 'wb')
         self.write_file_header(consolidated_file, num_records, self.num_planes, 19, 1)
         for filename in data_file_names:
             print('>>> Reading from ' + filename + ' ...')
-            file_path = self.data_dir + '/' + filename
-            single_dat = open(file_path, 'rb')
-            single_dat.read(1024)
-            data = single_dat.read()
-            if data[-3:] != 'END':
-                raise Exception('Invalid file, doesnt end with END: ' + file_path)
-            consolidated_file.write(data[:-3])
-            single_dat.close()
-        consolidated_file.write('END')
+            single_dat_path = self.data_dir + '/' + filename
+            with open(single_dat_path, 'rb') as single_dat:
+                single_dat.seek(-3, os.SEEK_END)
+                if single_dat.read(3) != b'END':
+                    raise Exception('Invalid file, doesnt end with END: ' + single_dat_path)
+                single_dat.seek(1024)
+                shutil.copyfileobj(single_dat, consolidated_file, COPY_BUFFER_SIZE)
+            # The next body, or the final END, overwrites this file's END.
+            consolidated_file.seek(-3, os.SEEK_CUR)
+        consolidated_file.write(b'END')
         consolidated_file.close()
+        self.write_manifest(file_path, num_records)
+
+    def write_manifest(self, data_file_path, num_records):
+        '''Store the record count of a .dat file in a small JSON file next to it.'''
+        with open(data_file_path + '.manifest', 'w') as manifest:
+            json.dump({'n': num_records, 'num_planes': self.num_planes}, manifest)
+
+    def read_num_records(self, data_file_path):
+        '''Number of records in a .dat file, from its manifest if there is one, otherwise from its header.'''
+        if os.path.isfile(data_file_path + '.manifest'):
+            with open(data_file_path + '.manifest') as manifest:
+                return json.load(manifest)['n']
+        with open(data_file_path, 'rb') as data_file:
+            header = data_file.read(1024)
+        return int(header.split(b'-n=')[1].split(b'-')[0])
@@ -0,0 +1,159 @@
+from __future__ import absolute_import
+
+import numpy as np
+import six
+from six.moves import range
+
+from .arrayboard import ArrayGoBoard, EMPTY, _COLOR_CODES
+
+__all__ = [
+    'BoardBatch',
+]
+
+
+def _point_storage(row):
+    # A memoryview reads and writes plain ints and is much faster to index than the numpy row itself. On
+    # Python 2 indexing a memoryview yields one-character strings, so the boards use the numpy row there.
+    return row if six.PY2 else memoryview(row)
+
+
+class BoardBatch(object):
+    '''
+    A batch of independent games stepped in lockstep. Every game lives on its own ArrayGoBoard, but the point
+    colors of all boards are stored in one stacked array: each board's points are a row view of it, so moves
+    played on a board show up in the batch without any copying. Feature planes and legal move masks for the
+    whole batch come out as single (num_games, ...) arrays that can be fed to a network in one call. Strings
+    and their liberties stay per board, so liberty counts are still gathered board by board.
+    '''
+
+    def __init__(self, num_games, board_size=19):
+        '''
+        Parameters
+        ----------
+        num_games: Number of games in the batch.
+        board_size: Side length of every board, defaulting to 19.
+        boards: List of the ArrayGoBoard of every game.
+        points: Array of shape (num_games, width * width) holding the padded point codes of every board. Row i
+            is the storage of boards[i].points.
+        '''
+        self.num_games = num_games
+        self.board_size = board_size
+        self.boards = [ArrayGoBoard(board_size) for _ in range(num_games)]
+        self.width = board_size + 2
+        self.points = np.array([np.frombuffer(board.points, dtype=np.int8) for board in self.boards])
+        for board, points in zip(self.boards, self.points):
+            board.points = _point_storage(points)
+
+    @property
+    def stones(self):
+        '''View of shape (num_games, board_size, board_size) holding EMPTY, BLACK or WHITE for every point.'''
+        return self.points.reshape(self.num_games, self.width, self.width)[:, 1:-1, 1:-1]
+
+    def _games(self, games):
+        return list(range(self.num_games)) if games is None else [int(game) for game in games]
+
+    def _colors(self, colors, games=None):
+        if isinstance(colors, six.string_types):
+            return [colors] * (self.num_games if games is None else len(games))
+        colors = list(colors)
+        return colors if games is None else [colors[game] for game in games]
+
+    def apply_moves(self, colors, moves):
+        '''
+        Play one move in every game.
+
+        Parameters:
+        -----------
+        colors: Color to play, either a single 'b' or 'w' for all games or one color per game.
+        moves: One (row, col) per game. None leaves the game untouched, e.g. for a pass or a finished game.
+        '''
+        for board, color, move in zip(self.boards, self._colors(colors), moves):
+            if move is not None:
+                board.apply_move(color, move)
+
+    def liberty_counts(self, games=None):
+        '''
+        Array of shape (num_games, board_size, board_size) with the liberties of the string at every stone.
+
+        Parameters:
+        -----------
+        games: Indices of the games to look at, defaulting to all. The result then has one entry per index.
+        '''
+        games = self._games(games)
+        counts = np.zeros((len(games), self.width * self.width), dtype=np.int16)
+        for board_counts, game in zip(counts, games):
+            for go_string in set(go_string for go_string in self.boards[game].strings if go_string is not None):
+                board_counts[list(go_string.stones)] = len(go_string.liberties)
+        return counts.reshape(len(games), self.width, self.width)[:, 1:-1, 1:-1]
+
+    def ko_points(self, colors, games=None):
+        '''
+        Boolean array of shape (num_games, board_size, board_size) marking simple ko points for colors.
+
+        Parameters:
+        -----------
+        colors: Color to move, either a single 'b' or 'w' for all games or one color per game.
+        games: Indices of the games to look at, defaulting to all. The result then has one entry per index.
+        '''
+        games = self._games(games)
+        ko = np.zeros((len(games), self.board_size, self.board_size), dtype=bool)
+        for index, (game, color) in enumerate(zip(games, self._colors(colors, games))):
+            board = self.boards[game]
+            # Only the neighbours of the last move can be a simple ko.
+            if board.ko_last_move_num_captured == 1:
+                for neighbor in board.neighbors[board.point_index(board.ko_last_move)]:
+                    if board.points[neighbor] == EMPTY:
+                        pos = board.point_position(neighbor)
+                        ko[(index,) + pos] = board.is_simple_ko(color, pos)
+        return ko
+
+    def legal_moves_masks(self, colors, games=None):
+        '''
+        Boolean array of shape (num_games, board_size, board_size) marking legal moves for colors.
+
+        Parameters:
+        -----------
+        colors: Color to move, either a single 'b' or 'w' for all games or one color per game.
+        games: Indices of the games to look at, defaulting to all. The result then has one entry per index.
+        '''
+        games = self._games(games)
+        masks = [self.boards[game].legal_moves_mask(color) for game, color in zip(games, self._colors(colors, games))]
+        return np.array(masks, dtype=bool).reshape(len(games), self.board_size, self.board_size)
+
+    def features(self, colors, num_planes=7, games=None):
+        '''
+        Feature planes of every game, as seen by the player to move, in one array of shape
+        (num_games, num_planes, board_size, board_size) of uint8. With seven planes the layout is that of
+        betago.processor.SevenPlaneProcessor, with three planes that of ThreePlaneProcessor.
+
+        Parameters:
+        -----------
+        colors: Color to move, either a single 'b' or 'w' for all games or one color per game.
+        num_planes: 7 or 3.
+        games: Indices of the games to compute features for, defaulting to all. The result then has one entry
+            per index, so finished games cost nothing.
+        '''
+        if num_planes not in (3, 7):
+            raise ValueError('Unsupported number of feature planes: ' + str(num_planes))
+        games = self._games(games)
+        own = np.array([_COLOR_CODES[color] for color in self._colors(colors, games)],
+                       dtype=np.int8).reshape(-1, 1, 1)
+        stones = self.stones[games]
+        ours = stones == own
+        theirs = (stones != own) & (stones != EMPTY)
+
+        features = np.zeros((len(games), num_planes, self.board_size, self.board_size), dtype=np.uint8)
+        if num_planes == 3:
+            features[:, 0] = ours
+            features[:, 1] = theirs
+        else:
+            liberties = self.liberty_counts(games)
+            for offset, side in ((0, ours), (3, theirs)):
+                features[:, offset] = side & (liberties == 1)
+                features[:, offset + 1] = side & (liberties == 2)
+                features[:, offset + 2] = side & (liberties >= 3)
+        features[:, -1] = self.ko_points(colors, games)
+        return features
+
+    def __str__(self):
+        return '\n'.join('Game %d: %s' % (index, board) for index, board in enumerate(self.boards))
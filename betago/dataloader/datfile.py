@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+
+import numpy as np
+from six.moves import range
+
+from .encoding import FEATURE_DTYPE, LABEL_DTYPE, model_input
+
+__all__ = [
+    'DatFile',
+    'parse_header',
+]
+
+HEADER_SIZE = 1024
+
+
+def parse_header(header):
+    '''
+    Parse the 1024 byte header written by GoFileProcessor.write_file_header, e.g.
+    'mlv2-n=100-num_planes=7-imagewidth=19-imageheight=19-datatype=int-bpp=1', into a dictionary with integer
+    values for n, num_planes, imagewidth, imageheight and bpp.
+    '''
+    if isinstance(header, bytes):
+        header = header.decode('ascii', 'replace')
+    header = header.split('\0')[0].strip()
+    fields = header.split('-')
+    if fields[0] != 'mlv2':
+        raise ValueError('Not an mlv2 file, header starts with %r' % fields[0])
+    values = dict(field.split('=', 1) for field in fields[1:])
+    for key in ('n', 'num_planes', 'imagewidth', 'imageheight', 'bpp'):
+        values[key] = int(values[key])
+    if values['bpp'] != 1:
+        raise ValueError('Only one bit per pixel is supported, got %d' % values['bpp'])
+    return values
+
+
+class DatFile(object):
+    '''
+    Random access to the records of an mlv2 .dat file, as written by SevenPlaneFileProcessor and consolidated by
+    GoFileProcessor.consolidate_games. The file is memory-mapped, so only the records of the requested batches
+    are ever read from disk, and their bit-packed planes are unpacked on the fly.
+    '''
+
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path: Path of the .dat file, e.g. data/kgsgo_train.
+        num_records: Number of records in the file, from its header.
+        num_planes: Number of feature planes per record.
+        board_size: Side length of the planes.
+        records: Memory map of all records, with fields magic ('GO'), label and planes (packed bits).
+        '''
+        with open(path, 'rb') as dat_file:
+            header = parse_header(dat_file.read(HEADER_SIZE))
+        self.path = path
+        self.num_records = header['n']
+        self.num_planes = header['num_planes']
+        self.board_size = header['imagewidth']
+        self.num_bits = self.num_planes * header['imagewidth'] * header['imageheight']
+        record_dtype = np.dtype([('magic', 'S2'), ('label', '<u2'), ('reserved', '<u2'),
+                                 ('planes', np.uint8, ((self.num_bits + 7) // 8,))])
+        if self.num_records == 0:
+            # Empty files can't be mapped.
+            self.records = np.zeros(0, dtype=record_dtype)
+        else:
+            self.records = np.memmap(path, dtype=record_dtype, mode='r', offset=HEADER_SIZE,
+                                     shape=(self.num_records,))
+
+    def __len__(self):
+        return self.num_records
+
+    def batch(self, indices):
+        '''
+        Features and labels of the records at the given indices, as a uint8 array of shape
+        (len(indices), num_planes, board_size, board_size) and an int16 array of move indices.
+        '''
+        records = self.records[np.asarray(indices)]
+        if (records['magic'] != b'GO').any():
+            raise ValueError('Corrupt record in ' + self.path)
+        X = np.unpackbits(records['planes'], axis=1)[:, :self.num_bits]
+        X = X.reshape((len(records), self.num_planes, self.board_size, self.board_size)).astype(FEATURE_DTYPE)
+        return X, records['label'].astype(LABEL_DTYPE)
+
+    def batches(self, batch_size=128, shuffle=True, seed=None):
+        '''
+        One pass over the file in batches of features and labels, see batch. With shuffle, records are visited in
+        random order; each batch is still read in file order to keep disk access sequential where possible.
+        '''
+        order = np.arange(self.num_records)
+        if shuffle:
+            np.random.RandomState(seed).shuffle(order)
+        for start in range(0, self.num_records, batch_size):
+            yield self.batch(np.sort(order[start:start + batch_size]))
+
+    def generate(self, batch_size=128, nb_classes=19 * 19, sparse_labels=False, shuffle=True, seed=None):
+        '''Endless generator of model ready batches, e.g. for keras fit_generator.'''
+        rng = np.random.RandomState(seed)
+        while True:
+            for X, y in self.batches(batch_size, shuffle, rng.randint(2 ** 31)):
+                yield model_input(X, y, nb_classes, sparse_labels)
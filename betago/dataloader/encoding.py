@@ -0,0 +1,24 @@
+from __future__ import absolute_import
+
+import numpy as np
+
+__all__ = [
+    'FEATURE_DTYPE',
+    'LABEL_DTYPE',
+    'model_input',
+]
+
+# Feature planes are binary, so processors store them as bytes; labels are move indices below 19 * 19.
+FEATURE_DTYPE = np.uint8
+LABEL_DTYPE = np.int16
+
+
+def model_input(X, y, nb_classes=19 * 19, sparse_labels=False):
+    '''
+    Convert features and labels as stored by the processors at the model boundary: features become float32,
+    labels one-hot float32 vectors, or int32 move indices for models trained with sparse_categorical_crossentropy.
+    One-hot encoding is done with numpy, so readers of stored data don't need keras.
+    '''
+    if sparse_labels:
+        return X.astype('float32'), y.astype('int32')
+    return X.astype('float32'), np.eye(nb_classes, dtype='float32')[y.astype(int)]
@@ -3,39 +3,117 @@
 # obtain one at http://mozilla.org/MPL/2.0/.
 
 from __future__ import absolute_import
-import copy
+import random
+
+import numpy as np
 from six.moves import range
 
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+_ZOBRIST_KEYS = {}
+
+
+def zobrist_keys(board_size):
+    '''
+    Random 64 bit keys for every (color, point) pair on a board of the given size. Returns a dictionary mapping
+    'b' and 'w' to dictionaries from (row, col) to key, together with the same keys as a uint64 array of shape
+    (2, board_size, board_size), black first. Keys are drawn from a fixed seed, so hashes are stable across
+    processes and can be stored alongside training data.
+    '''
+    keys = _ZOBRIST_KEYS.get(board_size)
+    if keys is None:
+        rng = random.Random(board_size)
+        key_array = np.zeros((2, board_size, board_size), dtype=np.uint64)
+        key_dict = {'b': {}, 'w': {}}
+        for plane, color in enumerate(('b', 'w')):
+            for row in range(board_size):
+                for col in range(board_size):
+                    key = rng.getrandbits(64)
+                    key_array[plane, row, col] = key
+                    key_dict[color][row, col] = key
+        keys = _ZOBRIST_KEYS[board_size] = key_dict, key_array
+    return keys
+
 
 class GoBoard(object):
     '''
     Representation of a go board. It contains "GoStrings" to represent stones and liberties. Moreover,
     the board can account for ko and handle captured stones.
     '''
-    def __init__(self, board_size=19):
+    __slots__ = ('ko_last_move_num_captured', 'ko_last_move', 'board_size', 'board', 'string_parent',
+                 'root_strings', 'go_strings', 'zobrist_hash', 'position_history', 'move_journal', 'string_class',
+                 'feature_planes')
+
+    def __init__(self, board_size=19, superko=False, string_class=None, feature_planes=False):
         '''
         Parameters
         ----------
         ko_last_move_num_captured: How many stones have been captured last move. If this is not 1, it can't be ko.
         ko_last_move: board position of the ko.
         board_size: Side length of the board, defaulting to 19.
-        go_strings: Dictionary of go_string objects representing stones and liberties.
+        go_strings: Read-only mapping from every stone to the go_string object it belongs to.
+        string_parent: Union-find forest over stones. Following parents from a stone leads to the root stone of
+                       its string.
+        root_strings: Dictionary from root stones to go_string objects representing stones and liberties.
+        superko: If True, remember the Zobrist hash of every position in position_history and treat moves
+                 that repeat one of them as illegal (positional superko).
+        move_journal: State saved by push_move, so that pop_move can take moves back.
+        string_class: Class used for new strings, BitsetGoString by default, whose stones and liberties merge
+                      with one bitwise or. GoString keeps them ordered by insertion instead, at the cost of
+                      merges that copy the smaller string element by element.
+        feature_planes: If True, keep a FeaturePlanes object holding stone colors and liberty counts of every
+                        point. apply_move only rewrites the strings a move touches, and the processors in
+                        betago.processor read their planes straight off it.
         '''
         self.ko_last_move_num_captured = 0
         self.ko_last_move = -3
         self.board_size = board_size
         self.board = {}
-        self.go_strings = {}
-
-    def fold_go_strings(self, target, source, join_position):
-        ''' Merge two go strings by joining their common moves'''
-        if target == source:
-            return
-        for stone_position in source.stones.stones:
-            self.go_strings[stone_position] = target
-            target.insert_stone(stone_position)
+        self.string_parent = {}
+        self.root_strings = {}
+        self.go_strings = GoStringLookup(self)
+        self.zobrist_hash = 0
+        self.position_history = set([0]) if superko else None
+        self.move_journal = []
+        self.string_class = BitsetGoString if string_class is None else string_class
+        self.feature_planes = FeaturePlanes(board_size) if feature_planes else None
+
+    @property
+    def board_hash(self):
+        '''Zobrist hash of the current position, maintained incrementally by apply_move.'''
+        return self.zobrist_hash
+
+    def find_root(self, pos):
+        '''Root stone of the string containing the stone at pos, compressing the path on the way.'''
+        parent = self.string_parent
+        while parent[pos] != pos:
+            parent[pos] = parent[parent[pos]]
+            pos = parent[pos]
+        return pos
+
+    def fold_go_strings(self, target_root, source_root, join_position):
+        '''
+        Merge two go strings, given by their root stones, by joining their common moves. The smaller string is
+        folded into the larger one, so its stones never need to be looked at again by go_strings. With the
+        default BitsetGoString, stones and liberties merge with a bitwise or, so the whole merge takes near
+        constant time; GoString still copies the smaller string. Returns the merged string.
+        '''
+        target = self.root_strings[target_root]
+        if target_root == source_root:
+            return target
+        source = self.root_strings[source_root]
+        if source.get_num_stones() > target.get_num_stones():
+            target_root, source_root = source_root, target_root
+            target, source = source, target
+        self.string_parent[source_root] = target_root
+        del self.root_strings[source_root]
+        target.copy_stones_from(source)
         target.copy_liberties_from(source)
         target.remove_liberty(join_position)
+        return target
 
     def add_adjacent_liberty(self, pos, go_string):
         '''
@@ -51,24 +129,114 @@ class GoBoard(object):
         return move in self.board
 
     def is_move_suicide(self, color, pos):
-        '''Check if a proposed move would be suicide.'''
-        # Make a copy of ourself to apply the move.
-        temp_board = copy.deepcopy(self)
-        temp_board.apply_move(color, pos)
-        new_string = temp_board.go_strings[pos]
-        return new_string.get_num_liberties() == 0
+        '''
+        Check if a proposed move would be suicide. This is decided from the adjacent strings alone, without
+        playing the move: the new stone survives if it touches an empty point, connects to one of our strings
+        that keeps another liberty, or captures at least one enemy string.
+        '''
+        enemy_color = self.other_color(color)
+        row, col = pos
+        num_captures = 0
+        for adjpos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            adj_row, adj_col = adjpos
+            if adj_row < 0 or adj_col < 0 or adj_row >= self.board_size or adj_col >= self.board_size:
+                continue
+            adj_color = self.board.get(adjpos)
+            if adj_color is None:
+                return False
+            num_liberties = self.go_strings[adjpos].get_num_liberties()
+            if adj_color == color and num_liberties > 1:
+                return False
+            if adj_color == enemy_color and num_liberties == 1:
+                num_captures = num_captures + 1
+        return num_captures == 0
 
     def is_move_legal(self, color, pos):
         '''Check if a proposed moved is legal.'''
         return (not self.is_move_on_board(pos)) and \
             (not self.is_move_suicide(color, pos)) and \
-            (not self.is_simple_ko(color, pos))
+            (not self.is_simple_ko(color, pos)) and \
+            (not self.is_positional_superko(color, pos))
+
+    def hash_after_move(self, color, pos):
+        '''Zobrist hash of the position after color plays at pos, computed without playing the move.'''
+        keys, _ = zobrist_keys(self.board_size)
+        enemy_color = self.other_color(color)
+        new_hash = self.zobrist_hash ^ keys[color][pos]
+        row, col = pos
+        captured = set()
+        for adjpos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            if self.board.get(adjpos) == enemy_color:
+                enemy_string = self.go_strings[adjpos]
+                if enemy_string.get_num_liberties() == 1 and enemy_string not in captured:
+                    captured.add(enemy_string)
+                    for stone in enemy_string.stones.stones:
+                        new_hash ^= keys[enemy_color][stone]
+        return new_hash
+
+    def is_positional_superko(self, color, pos):
+        '''
+        Check if a proposed move would repeat an earlier position. Always False unless the board was created
+        with superko=True.
+        '''
+        if self.position_history is None:
+            return False
+        return self.hash_after_move(color, pos) in self.position_history
+
+    def legal_moves_mask(self, color):
+        '''
+        Boolean array of shape (board_size, board_size) marking every point where color may legally play, i.e.
+        empty points that are neither suicide nor simple ko. Computed in one pass over the strings on the board
+        instead of calling is_move_legal point by point.
+        '''
+        size = self.board_size
+        # Grids carry a one point border, so neighbours of edge points can be read with plain slices.
+        empty = np.zeros((size + 2, size + 2), dtype=bool)
+        empty[1:-1, 1:-1] = True
+        # Stones a new stone can safely touch: ours with another liberty, or theirs about to be captured.
+        safe_stones = np.zeros((size + 2, size + 2), dtype=bool)
+        for go_string in self.root_strings.values():
+            num_liberties = go_string.get_num_liberties()
+            is_safe = num_liberties > 1 if go_string.color == color else num_liberties == 1
+            for row, col in go_string.stones.stones:
+                empty[row + 1, col + 1] = False
+                safe_stones[row + 1, col + 1] = is_safe
+        safe = empty | safe_stones
+        legal = empty[1:-1, 1:-1] & (safe[:-2, 1:-1] | safe[2:, 1:-1] | safe[1:-1, :-2] | safe[1:-1, 2:])
+
+        # Only the neighbours of the last move can be a simple ko.
+        if self.ko_last_move_num_captured == 1:
+            row, col = self.ko_last_move
+            for adjpos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+                adj_row, adj_col = adjpos
+                if 0 <= adj_row < size and 0 <= adj_col < size and self.is_simple_ko(color, adjpos):
+                    legal[adj_row, adj_col] = False
+
+        if self.position_history is not None:
+            legal &= ~self._superko_mask(color)
+        return legal
+
+    def _superko_mask(self, color):
+        '''Boolean array marking every point where a move by color would repeat an earlier position.'''
+        keys, key_array = zobrist_keys(self.board_size)
+        enemy_color = self.other_color(color)
+        new_hashes = key_array[0 if color == 'b' else 1] ^ np.uint64(self.zobrist_hash)
+        # Moves that fill the last liberty of enemy strings also remove those stones from the hash.
+        for enemy_string in self.root_strings.values():
+            if enemy_string.color == enemy_color and enemy_string.get_num_liberties() == 1:
+                captured_hash = 0
+                for stone in enemy_string.stones.stones:
+                    captured_hash ^= keys[enemy_color][stone]
+                new_hashes[enemy_string.get_liberty(0)] ^= np.uint64(captured_hash)
+        history = np.array(list(self.position_history), dtype=np.uint64)
+        return np.isin(new_hashes, history)
 
     def create_go_string(self, color, pos):
         ''' Create GoString from current Board and move '''
-        go_string = GoString(self.board_size, color)
+        go_string = self.string_class(self.board_size, color)
         go_string.insert_stone(pos)
-        self.go_strings[pos] = go_string
+        self.string_parent[pos] = pos
+        self.root_strings[pos] = go_string
         self.board[pos] = color
 
         row, col = pos
@@ -138,10 +306,13 @@ class GoBoard(object):
         # Update adjacent liberties on board
         enemy_string.remove_liberty(our_pos)
         if enemy_string.get_num_liberties() == 0:
+            keys, _ = zobrist_keys(self.board_size)
+            del self.root_strings[self.find_root(enemy_pos)]
             for enemy_pos in enemy_string.stones.stones:
                 string_row, string_col = enemy_pos
                 del self.board[enemy_pos]
-                del self.go_strings[enemy_pos]
+                del self.string_parent[enemy_pos]
+                self.zobrist_hash ^= keys[enemy_color][enemy_pos]
                 self.ko_last_move_num_captured = self.ko_last_move_num_captured + 1
                 for adjstring in [(string_row - 1, string_col), (string_row + 1, string_col),
                                   (string_row, string_col - 1), (string_row, string_col + 1)]:
@@ -158,6 +329,7 @@ class GoBoard(object):
         if pos in self.board:
             raise ValueError('Move ' + str(pos) + 'is already on board.')
 
+        touched = None if self.feature_planes is None else self._strings_touched_by(play_color, pos)
         self.ko_last_move_num_captured = 0
         row, col = pos
 
@@ -177,6 +349,89 @@ class GoBoard(object):
         # Store last move for ko
         self.ko_last_move = pos
 
+        # Update the position hash, captured stones have already been hashed out
+        keys, _ = zobrist_keys(self.board_size)
+        self.zobrist_hash ^= keys[play_color][pos]
+        if self.position_history is not None:
+            self.position_history.add(self.zobrist_hash)
+
+        if touched is not None:
+            self._update_feature_planes(play_string, touched)
+
+    def _update_feature_planes(self, play_string, touched):
+        '''Rewrite the feature planes for the string just played and the strings touched by the move.'''
+        feature_planes = self.feature_planes
+        for root, go_string in touched:
+            if root not in self.string_parent:
+                feature_planes.clear(go_string.stones.stones)
+            elif self.go_strings[root] is not play_string:
+                feature_planes.set_string(self.go_strings[root])
+        feature_planes.set_string(play_string)
+
+    def push_move(self, play_color, pos):
+        '''
+        Execute move like apply_move, but journal enough state to take it back with pop_move. Only the strings
+        adjacent to the move, and our strings adjacent to anything it captures, are saved, so this is much
+        cheaper than copying the board.
+        '''
+        saved_strings = [(root, go_string, go_string.stones.copy(), go_string.liberties.copy())
+                         for root, go_string in self._strings_touched_by(play_color, pos)]
+        history_size = None if self.position_history is None else len(self.position_history)
+        journal_entry = (pos, saved_strings, self.ko_last_move, self.ko_last_move_num_captured,
+                         self.zobrist_hash, history_size)
+        # Only journal moves that were actually played, so a rejected move can't be taken back.
+        self.apply_move(play_color, pos)
+        self.move_journal.append(journal_entry)
+
+    def pop_move(self):
+        '''
+        Take back the last move played with push_move, restoring captured strings, liberties and ko state.
+        '''
+        pos, saved_strings, ko_last_move, ko_last_move_num_captured, zobrist_hash, history_size = \
+            self.move_journal.pop()
+        if history_size is not None and len(self.position_history) > history_size:
+            self.position_history.discard(self.zobrist_hash)
+        del self.board[pos]
+        del self.string_parent[pos]
+        self.root_strings.pop(pos, None)
+        for root, go_string, stones, liberties in saved_strings:
+            go_string.stones = stones
+            go_string.liberties = liberties
+            self.root_strings[root] = go_string
+            # Merges and path compression may have pointed these stones elsewhere.
+            for stone_position in stones.stones:
+                self.board[stone_position] = go_string.color
+                self.string_parent[stone_position] = root
+        self.ko_last_move = ko_last_move
+        self.ko_last_move_num_captured = ko_last_move_num_captured
+        self.zobrist_hash = zobrist_hash
+        if self.feature_planes is not None:
+            self.feature_planes.clear([pos])
+            for _, go_string, _, _ in saved_strings:
+                self.feature_planes.set_string(go_string)
+
+    def _strings_touched_by(self, play_color, pos):
+        '''Roots and strings of all strings apply_move may modify when play_color plays at pos.'''
+        enemy_color = self.other_color(play_color)
+        touched = {}
+        row, col = pos
+        for adjpos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]:
+            if adjpos not in self.board:
+                continue
+            adj_root = self.find_root(adjpos)
+            if adj_root in touched:
+                continue
+            adj_string = touched[adj_root] = self.root_strings[adj_root]
+            if adj_string.color == enemy_color and adj_string.get_num_liberties() == 1:
+                # The string gets captured, which hands out liberties to our strings around it.
+                for string_row, string_col in adj_string.stones.stones:
+                    for neighbor in [(string_row - 1, string_col), (string_row + 1, string_col),
+                                     (string_row, string_col - 1), (string_row, string_col + 1)]:
+                        if self.board.get(neighbor) == play_color:
+                            neighbor_root = self.find_root(neighbor)
+                            touched[neighbor_root] = self.root_strings[neighbor_root]
+        return list(touched.items())
+
     def add_liberty_to_adjacent_string(self, string_pos, liberty_pos, color):
         ''' Insert liberty into corresponding GoString '''
         if self.board.get(string_pos) != color:
@@ -191,9 +446,7 @@ class GoBoard(object):
             return first_string
         if self.board.get(pos) != color:
             return first_string
-        string_to_fold = self.go_strings[pos]
-        self.fold_go_strings(string_to_fold, first_string, join_position)
-        return string_to_fold
+        return self.fold_go_strings(self.find_root(pos), self.find_root(join_position), join_position)
 
     def __str__(self):
         result = 'GoBoard\n'
@@ -211,10 +464,81 @@ class GoBoard(object):
         return result
 
 
+class FeaturePlanes(object):
+    '''
+    Stone colors and liberty counts of every point of a GoBoard, as (board_size, board_size) arrays. stones holds
+    BLACK, WHITE or EMPTY, liberties the number of liberties of the string at every stone and 0 elsewhere.
+    '''
+    __slots__ = ('stones', 'liberties')
+
+    EMPTY = 0
+    BLACK = 1
+    WHITE = 2
+    COLOR_CODES = {'b': BLACK, 'w': WHITE}
+
+    def __init__(self, board_size=19):
+        self.stones = np.zeros((board_size, board_size), dtype=np.int8)
+        self.liberties = np.zeros((board_size, board_size), dtype=np.int16)
+
+    def __deepcopy__(self, memo):
+        planes = FeaturePlanes.__new__(FeaturePlanes)
+        planes.stones = self.stones.copy()
+        planes.liberties = self.liberties.copy()
+        return planes
+
+    def set_string(self, go_string):
+        '''Write color and liberty count of a string to all of its stones.'''
+        code = self.COLOR_CODES[go_string.color]
+        num_liberties = go_string.get_num_liberties()
+        stones, liberties = self.stones, self.liberties
+        for pos in go_string.stones.stones:
+            stones[pos] = code
+            liberties[pos] = num_liberties
+
+    def clear(self, positions):
+        '''Mark the given points as empty.'''
+        for pos in positions:
+            self.stones[pos] = self.EMPTY
+            self.liberties[pos] = 0
+
+
+class GoStringLookup(Mapping):
+    '''
+    Read-only mapping from the position of every stone on a GoBoard to the GoString containing it, resolved
+    through the board's union-find forest.
+    '''
+    __slots__ = ('go_board',)
+
+    def __init__(self, go_board):
+        self.go_board = go_board
+
+    def __getitem__(self, pos):
+        go_board = self.go_board
+        if pos not in go_board.string_parent:
+            raise KeyError(pos)
+        return go_board.root_strings[go_board.find_root(pos)]
+
+    def get(self, pos, default=None):
+        if pos not in self.go_board.string_parent:
+            return default
+        return self[pos]
+
+    def __contains__(self, pos):
+        return pos in self.go_board.string_parent
+
+    def __iter__(self):
+        return iter(self.go_board.string_parent)
+
+    def __len__(self):
+        return len(self.go_board.string_parent)
+
+
 class BoardSequence(object):
     '''
     Store a sequence of locations on a board, which could either represent stones or liberties.
     '''
+    __slots__ = ('board_size', 'stones', 'board')
+
     def __init__(self, board_size=19):
         self.board_size = board_size
         self.stones = []
@@ -244,6 +568,16 @@ class BoardSequence(object):
     def exists(self, combo):
         return combo in self.board
 
+    def copy(self):
+        sequence = BoardSequence(self.board_size)
+        sequence.stones = list(self.stones)
+        sequence.board = dict(self.board)
+        return sequence
+
+    def __deepcopy__(self, memo):
+        # Locations are tuples of ints, so a shallow copy is already a deep one.
+        return self.copy()
+
     def size(self):
         return len(self.stones)
 
@@ -267,6 +601,8 @@ class GoString(object):
     '''
     Represents a string of contiguous stones of one color on the board, including a list of all its liberties.
     '''
+    __slots__ = ('board_size', 'color', 'liberties', 'stones')
+
     def __init__(self, board_size, color):
         self.board_size = board_size
         self.color = color
@@ -294,6 +630,18 @@ class GoString(object):
     def insert_liberty(self, combo):
         self.liberties.insert(combo)
 
+    def __deepcopy__(self, memo):
+        go_string = self.__class__.__new__(self.__class__)
+        go_string.board_size = self.board_size
+        go_string.color = self.color
+        go_string.liberties = self.liberties.copy()
+        go_string.stones = self.stones.copy()
+        return go_string
+
+    def copy_stones_from(self, source):
+        for stonePos in source.stones.stones:
+            self.stones.insert(stonePos)
+
     def copy_liberties_from(self, source):
         for libertyPos in source.liberties.stones:
             self.liberties.insert(libertyPos)
@@ -303,6 +651,99 @@ class GoString(object):
         return result
 
 
+class BoardBitset(object):
+    '''
+    Set of locations on a board stored as the bits of a single integer, with bit row * board_size + col standing
+    for (row, col). Offers the interface of BoardSequence, but merging two sets is one bitwise or.
+    '''
+    __slots__ = ('board_size', 'bits', 'count')
+
+    def __init__(self, board_size=19, bits=0):
+        self.board_size = board_size
+        self.bits = bits
+        self.count = bin(bits).count('1')
+
+    def insert(self, combo):
+        row, col = combo
+        bit = 1 << (row * self.board_size + col)
+        if not self.bits & bit:
+            self.bits |= bit
+            self.count += 1
+
+    def erase(self, combo):
+        row, col = combo
+        bit = 1 << (row * self.board_size + col)
+        if self.bits & bit:
+            self.bits ^= bit
+            self.count -= 1
+
+    def exists(self, combo):
+        row, col = combo
+        return bool(self.bits >> (row * self.board_size + col) & 1)
+
+    def update(self, other):
+        self.bits |= other.bits
+        self.count = bin(self.bits).count('1')
+
+    def copy(self):
+        bitset = BoardBitset(self.board_size)
+        bitset.bits = self.bits
+        bitset.count = self.count
+        return bitset
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def size(self):
+        return self.count
+
+    @property
+    def stones(self):
+        '''All locations in the set, in order of their bit index.'''
+        result = []
+        bits = self.bits
+        while bits:
+            lowest_bit = bits & -bits
+            result.append(divmod(lowest_bit.bit_length() - 1, self.board_size))
+            bits ^= lowest_bit
+        return result
+
+    def __getitem__(self, iid):
+        return self.stones[iid]
+
+    def __str__(self):
+        result = 'BoardBitset\n'
+        for row in range(self.board_size - 1, -1, -1):
+            thisline = ""
+            for col in range(0, self.board_size):
+                if self.exists((row, col)):
+                    thisline = thisline + "*"
+                else:
+                    thisline = thisline + "."
+            result = result + thisline + "\n"
+        return result
+
+
+class BitsetGoString(GoString):
+    '''
+    GoString keeping its stones and liberties as BoardBitsets, so merging strings and counting liberties are
+    bitwise operations. This is the string class GoBoard uses by default.
+    '''
+    __slots__ = ()
+
+    def __init__(self, board_size, color):
+        self.board_size = board_size
+        self.color = color
+        self.liberties = BoardBitset(board_size)
+        self.stones = BoardBitset(board_size)
+
+    def copy_stones_from(self, source):
+        self.stones.update(source.stones)
+
+    def copy_liberties_from(self, source):
+        self.liberties.update(source.liberties)
+
+
 def from_string(board_string):
     """Build a board from an ascii-art representation.
 
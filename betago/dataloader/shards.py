@@ -0,0 +1,187 @@
+from __future__ import absolute_import
+
+import json
+import os
+
+import numpy as np
+from six.moves import range
+
+from .encoding import FEATURE_DTYPE, LABEL_DTYPE, model_input
+
+__all__ = [
+    'ShardWriter',
+    'ShardedArray',
+    'ShardedDataset',
+]
+
+# Examples per shard. With seven uint8 planes that is about 40 MB of features.
+SHARD_SIZE = 16384
+
+
+class ShardWriter(object):
+    '''
+    Write features and labels to disk as a sharded dataset: numbered pairs of .npy files with shard_size examples
+    each (the last one may hold fewer) plus a JSON manifest listing them. Examples are appended incrementally, so
+    at most one shard is ever held in memory.
+    '''
+
+    def __init__(self, directory, prefix, feature_shape, shard_size=SHARD_SIZE,
+                 feature_dtype=FEATURE_DTYPE, label_dtype=LABEL_DTYPE):
+        '''
+        Parameters
+        ----------
+        directory: Folder to write shards and manifest to.
+        prefix: Common prefix of all files, the manifest is stored as prefix + '_manifest.json'.
+        feature_shape: Shape of the features of a single example, e.g. (7, 19, 19).
+        shard_size: Number of examples per shard.
+        '''
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.features = np.zeros((shard_size,) + tuple(feature_shape), dtype=feature_dtype)
+        self.labels = np.zeros((shard_size,), dtype=label_dtype)
+        self.num_buffered = 0
+        self.shards = []
+        self.num_examples = 0
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, self.prefix + '_manifest.json')
+
+    def append(self, features, labels):
+        '''Append a block of examples, e.g. a memory-mapped feature file and its labels.'''
+        start = 0
+        while start < len(labels):
+            if self.num_buffered == self.shard_size:
+                self._flush()
+            count = min(len(labels) - start, self.shard_size - self.num_buffered)
+            self.features[self.num_buffered:self.num_buffered + count] = features[start:start + count]
+            self.labels[self.num_buffered:self.num_buffered + count] = labels[start:start + count]
+            self.num_buffered += count
+            start += count
+
+    def add(self, label):
+        '''
+        Append a single example with the given label and return its zero-filled features, a view into the shard
+        buffer to be written in place, e.g. by a processor's fill_features.
+        '''
+        # Full shards are written when the next example arrives, so the returned row stays valid until then.
+        if self.num_buffered == self.shard_size:
+            self._flush()
+        features = self.features[self.num_buffered]
+        features[...] = 0
+        self.labels[self.num_buffered] = label
+        self.num_buffered += 1
+        return features
+
+    def _flush(self):
+        shard = len(self.shards)
+        feature_file = '%s_features_%05d.npy' % (self.prefix, shard)
+        label_file = '%s_labels_%05d.npy' % (self.prefix, shard)
+        np.save(os.path.join(self.directory, feature_file), self.features[:self.num_buffered])
+        np.save(os.path.join(self.directory, label_file), self.labels[:self.num_buffered])
+        self.shards.append({'features': feature_file, 'labels': label_file,
+                            'offset': self.num_examples, 'num_examples': self.num_buffered})
+        self.num_examples += self.num_buffered
+        self.num_buffered = 0
+
+    def close(self):
+        '''Write the last, partial shard and the manifest. Returns the path of the manifest.'''
+        if self.num_buffered > 0:
+            self._flush()
+        with open(self.manifest_path, 'w') as manifest:
+            json.dump({'num_examples': self.num_examples, 'shard_size': self.shard_size,
+                       'feature_shape': list(self.features.shape[1:]), 'shards': self.shards}, manifest)
+        return self.manifest_path
+
+
+class ShardedArray(object):
+    '''
+    Read-only, array-like view of one field (features or labels) of a sharded dataset. Shards are memory-mapped
+    on first access, indexing only reads the shards it touches, and np.asarray or astype load the whole array.
+    '''
+
+    def __init__(self, directory, files, offsets, shape, dtype):
+        self.directory = directory
+        self.files = files
+        self.offsets = np.asarray(offsets)
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._shards = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def shard(self, number):
+        '''Memory map of a single shard.'''
+        if number not in self._shards:
+            self._shards[number] = np.load(os.path.join(self.directory, self.files[number]), mmap_mode='r')
+        return self._shards[number]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            index = np.arange(*index.indices(len(self)))
+        elif np.isscalar(index):
+            index = int(index) + len(self) if index < 0 else int(index)
+            number = np.searchsorted(self.offsets, index, side='right') - 1
+            return np.array(self.shard(number)[index - self.offsets[number]])
+        index = np.asarray(index)
+        result = np.empty((len(index),) + self.shape[1:], dtype=self.dtype)
+        numbers = np.searchsorted(self.offsets, index, side='right') - 1
+        for number in np.unique(numbers):
+            rows = numbers == number
+            result[rows] = self.shard(number)[index[rows] - self.offsets[number]]
+        return result
+
+    def __array__(self, dtype=None, copy=None):
+        result = np.empty(self.shape, dtype=self.dtype)
+        for number, offset in enumerate(self.offsets):
+            shard = self.shard(number)
+            result[offset:offset + len(shard)] = shard
+        return result if dtype is None else result.astype(dtype)
+
+    def astype(self, dtype):
+        return np.asarray(self).astype(dtype)
+
+
+class ShardedDataset(object):
+    '''
+    A sharded dataset written by ShardWriter, opened lazily from its manifest. features and labels are
+    ShardedArray views, generate serves model ready batches for keras fit_generator.
+    '''
+
+    def __init__(self, manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        directory = os.path.dirname(manifest_path)
+        shards = manifest['shards']
+        offsets = [shard['offset'] for shard in shards]
+        num_examples = manifest['num_examples']
+        feature_dtype = label_dtype = None
+        if shards:
+            first_features = np.load(os.path.join(directory, shards[0]['features']), mmap_mode='r')
+            first_labels = np.load(os.path.join(directory, shards[0]['labels']), mmap_mode='r')
+            feature_dtype, label_dtype = first_features.dtype, first_labels.dtype
+        self.num_examples = num_examples
+        self.features = ShardedArray(directory, [shard['features'] for shard in shards], offsets,
+                                     [num_examples] + manifest['feature_shape'], feature_dtype or FEATURE_DTYPE)
+        self.labels = ShardedArray(directory, [shard['labels'] for shard in shards], offsets,
+                                   [num_examples], label_dtype or LABEL_DTYPE)
+
+    def __len__(self):
+        return self.num_examples
+
+    def batch(self, indices):
+        '''Features and labels of the examples at the given indices.'''
+        return self.features[indices], self.labels[indices]
+
+    def generate(self, batch_size=128, nb_classes=19 * 19, sparse_labels=False, shuffle=True, seed=None):
+        '''Endless generator of model ready batches, visiting examples in random order with shuffle.'''
+        rng = np.random.RandomState(seed)
+        while True:
+            order = np.arange(self.num_examples)
+            if shuffle:
+                rng.shuffle(order)
+            for start in range(0, self.num_examples, batch_size):
+                X, y = self.batch(np.sort(order[start:start + batch_size]))
+                yield model_input(X, y, nb_classes, sparse_labels)
@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+
+import numpy as np
+
+__all__ = [
+    'NUM_SYMMETRIES',
+    'inverse_symmetry',
+    'transform_labels',
+    'transform_planes',
+]
+
+# The dihedral group of the square: four rotations, each optionally followed by a reflection.
+NUM_SYMMETRIES = 8
+
+_LABEL_MAPS = {}
+
+
+def transform_planes(X, symmetry):
+    '''
+    Rotate and reflect feature planes. Symmetry 0 to 3 turns the board by that many quarter turns, 4 to 7 does the
+    same and then mirrors the columns. Works on any array whose last two axes are rows and columns, and returns a
+    view of X, no data is copied.
+    '''
+    X = np.rot90(X, symmetry % 4, axes=(-2, -1))
+    if symmetry >= 4:
+        X = X[..., ::-1]
+    return X
+
+
+def transform_labels(y, symmetry, board_size=19):
+    '''
+    Map move indices (row * board_size + col) to where transform_planes moves the same points.
+    '''
+    key = (symmetry, board_size)
+    label_map = _LABEL_MAPS.get(key)
+    if label_map is None:
+        points = np.arange(board_size * board_size).reshape(board_size, board_size)
+        label_map = np.empty(board_size * board_size, dtype=np.int64)
+        label_map[transform_planes(points, symmetry).ravel()] = np.arange(board_size * board_size)
+        _LABEL_MAPS[key] = label_map
+    return label_map[y].astype(np.asarray(y).dtype)
+
+
+def inverse_symmetry(symmetry):
+    '''The symmetry undoing the given one. Reflections are their own inverse, rotations turn back.'''
+    if symmetry >= 4:
+        return symmetry
+    return (4 - symmetry) % 4
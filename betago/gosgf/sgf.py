@@ -31,6 +31,7 @@ class Node(object):
     Changing the SZ property isn't allowed.
 
     """
+    __slots__ = ('_property_map', '_presenter')
 
     def __init__(self, property_map, presenter):
         # Map identifier (PropIdent) -> nonempty list of raw values
@@ -348,6 +349,7 @@ class Tree_node(Node):
       parent -- the nodes's parent Tree_node (None for the root node)
 
     """
+    __slots__ = ('owner', 'parent', '_children')
 
     def __init__(self, parent, properties):
         self.owner = parent.owner
@@ -453,6 +455,9 @@ class Tree_node(Node):
 
 class _Root_tree_node(Tree_node):
     """Variant of Tree_node used for a game root."""
+    # _coarse_tree is only used by _Unexpanded_root_tree_node, but both
+    # classes need the same slots so that _expand() can switch __class__.
+    __slots__ = ('_coarse_tree',)
 
     def __init__(self, property_map, owner):
         self.owner = owner
@@ -463,6 +468,7 @@ class _Root_tree_node(Tree_node):
 
 class _Unexpanded_root_tree_node(_Root_tree_node):
     """Variant of _Root_tree_node used with 'loaded' Sgf_games."""
+    __slots__ = ()
 
     def __init__(self, owner, coarse_tree):
         _Root_tree_node.__init__(self, coarse_tree.sequence[0], owner)
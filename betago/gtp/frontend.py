@@ -59,7 +59,7 @@ class GTPFrontend(object):
         return response.success()
 
     def handle_clear_board(self):
-        self.bot.set_board(GoBoard())
+        self.bot.set_board(GoBoard(feature_planes=True))
         return response.success()
 
     def handle_known_command(self, command_name):
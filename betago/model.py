@@ -10,6 +10,7 @@ from flask_cors import CORS
 import numpy as np
 from . import scoring
 from .dataloader.goboard import GoBoard
+from .dataloader.symmetry import NUM_SYMMETRIES, inverse_symmetry, transform_planes
 from .processor import ThreePlaneProcessor
 from six.moves import range
 
@@ -115,7 +116,7 @@ class GoModel(object):
         '''
         self.model = model
         self.processor = processor
-        self.go_board = GoBoard(19)
+        self.go_board = GoBoard(19, feature_planes=True)
         self.num_planes = processor.num_planes
 
     def set_board(self, board):
@@ -133,14 +134,17 @@ class GoModel(object):
 
 class KerasBot(GoModel):
     '''
-    KerasBot takes top_n predictions of a keras model and tries to apply the best move. If that move is illegal,
-    choose the next best, until the list is exhausted. If no more moves are left to play, continue with random
-    moves until a legal move is found.
+    KerasBot masks the predictions of a keras model down to legal moves, then plays the best of the top_n. If
+    no predicted move is legal, continue with random moves until a legal move is found.
+
+    With symmetric=True, the position is fed to the model in all eight rotations and reflections in one batch,
+    and the predictions, turned back to the original orientation, are averaged.
     '''
 
-    def __init__(self, model, processor, top_n=10):
+    def __init__(self, model, processor, top_n=10, symmetric=False):
         super(KerasBot, self).__init__(model=model, processor=processor)
         self.top_n = top_n
+        self.symmetric = symmetric
 
     def apply_move(self, color, move):
         # Apply human move
@@ -170,18 +174,30 @@ class KerasBot(GoModel):
         # The (0, 0) is for generating the label, which we ignore.
         X, label = self.processor.feature_and_label(
             bot_color, (0, 0), self.go_board, self.num_planes)
-        X = X.reshape((1, X.shape[0], X.shape[1], X.shape[2]))
 
-        # Generate bot move.
-        pred = np.squeeze(self.model.predict(X))
+        # Generate bot move. Illegal moves are masked out up front, so every move we yield can be played.
+        pred = self._predict(X)
+        legal = self.go_board.legal_moves_mask(bot_color).flatten()
+        pred = np.where(legal, pred, -1)
         top_n_pred_idx = pred.argsort()[-self.top_n:][::-1]
         for idx in top_n_pred_idx:
+            if not legal[idx]:
+                break
             prediction = int(idx)
             pred_row = prediction // 19
             pred_col = prediction % 19
             pred_move = (pred_row, pred_col)
             yield pred_move
 
+    def _predict(self, X):
+        '''Flat 19 * 19 prediction of the model for the feature planes X of a single position.'''
+        if not self.symmetric:
+            return np.squeeze(self.model.predict(X[np.newaxis].astype('float32')))
+        X = np.array([transform_planes(X, symmetry) for symmetry in range(NUM_SYMMETRIES)], dtype='float32')
+        preds = self.model.predict(X).reshape((NUM_SYMMETRIES, 19, 19))
+        return np.mean([transform_planes(pred, inverse_symmetry(symmetry))
+                        for symmetry, pred in enumerate(preds)], axis=0).flatten()
+
 
 class RandomizedKerasBot(GoModel):
     '''
@@ -223,13 +239,17 @@ class RandomizedKerasBot(GoModel):
         X = X.reshape((1, X.shape[0], X.shape[1], X.shape[2]))
 
         # Generate moves from the keras model.
-        n_samples = 20
-        pred = np.squeeze(self.model.predict(X))
+        pred = np.squeeze(self.model.predict(X.astype('float32')))
         # Cube the predictions to increase the difference between the
         # best and worst moves. Otherwise, it will make too many
         # nonsense moves. (There's no scientific basis for this, it's
         # just an ad-hoc adjustment)
         pred = pred * pred * pred
+        # Only sample among legal moves.
+        pred = pred * self.go_board.legal_moves_mask(bot_color).flatten()
+        n_samples = min(20, np.count_nonzero(pred))
+        if n_samples == 0:
+            return
         pred /= pred.sum()
         moves = np.random.choice(19 * 19, size=n_samples, replace=False, p=pred)
         for prediction in moves:
@@ -1,7 +1,61 @@
 from __future__ import absolute_import
+import struct
+
 import numpy as np
 from .dataloader.base_processor import GoDataProcessor, GoFileProcessor
-from six.moves import range
+from .dataloader.encoding import FEATURE_DTYPE
+from .dataloader.goboard import FeaturePlanes
+
+
+def stone_and_liberty_grids(color, go_board):
+    '''
+    Return three (board_size, board_size) arrays: boolean masks of the stones of color and of the other color,
+    and the number of liberties of the string at every stone. Boards keeping FeaturePlanes hand these out
+    directly, otherwise only the occupied points are visited and each grid is filled with a single assignment.
+    '''
+    feature_planes = getattr(go_board, 'feature_planes', None)
+    if feature_planes is not None:
+        own = FeaturePlanes.COLOR_CODES[color]
+        stones = feature_planes.stones
+        return stones == own, (stones != own) & (stones != FeaturePlanes.EMPTY), feature_planes.liberties
+
+    board_size = go_board.board_size
+    points, sides, liberties = [], [], []
+    go_strings = go_board.go_strings
+    for (row, col), stone_color in go_board.board.items():
+        points.append(row * board_size + col)
+        sides.append(1 if stone_color == color else -1)
+        liberties.append(go_strings[row, col].liberties.size())
+    side_grid = np.zeros(board_size * board_size, dtype=np.int8)
+    liberty_grid = np.zeros(board_size * board_size, dtype=np.int16)
+    side_grid[points] = sides
+    liberty_grid[points] = liberties
+    side_grid = side_grid.reshape(board_size, board_size)
+    return side_grid == 1, side_grid == -1, liberty_grid.reshape(board_size, board_size)
+
+
+def simple_ko_points(color, go_board):
+    '''
+    List the points where color is barred from playing by simple ko. Only the neighbours of the last move can
+    be a ko, so those are the only points checked.
+    '''
+    if go_board.ko_last_move_num_captured != 1 or go_board.ko_last_move is None:
+        return []
+    row, col = go_board.ko_last_move
+    return [pos for pos in [(row - 1, col), (row + 1, col), (row, col - 1), (row, col + 1)]
+            if 0 <= pos[0] < go_board.board_size and 0 <= pos[1] < go_board.board_size and
+            go_board.is_simple_ko(color, pos)]
+
+
+def fill_seven_planes(color, go_board, out):
+    '''Write the seven planes described in SevenPlaneProcessor into out, a zero-filled (7, 19, 19) array.'''
+    ours, theirs, liberties = stone_and_liberty_grids(color, go_board)
+    for offset, stones in ((0, ours), (3, theirs)):
+        out[offset][stones & (liberties == 1)] = 1
+        out[offset + 1][stones & (liberties == 2)] = 1
+        out[offset + 2][stones & (liberties >= 3)] = 1
+    for pos in simple_ko_points(color, go_board):
+        out[(6,) + pos] = 1
 
 
 class SevenPlaneProcessor(GoDataProcessor):
@@ -13,11 +67,12 @@ class SevenPlaneProcessor(GoDataProcessor):
     http://arxiv.org/abs/1412.3409
     '''
 
-    def __init__(self, data_directory='data', num_planes=7, consolidate=True, use_generator=False):
+    def __init__(self, data_directory='data', num_planes=7, consolidate=True, use_generator=False, augment=None):
         super(SevenPlaneProcessor, self).__init__(data_directory=data_directory,
                                                   num_planes=num_planes,
                                                   consolidate=consolidate,
-                                                  use_generator=use_generator)
+                                                  use_generator=use_generator,
+                                                  augment=augment)
 
     def feature_and_label(self, color, move, go_board, num_planes):
         '''
@@ -37,29 +92,12 @@ class SevenPlaneProcessor(GoDataProcessor):
         6: simple ko
         '''
         row, col = move
-        enemy_color = go_board.other_color(color)
-        label = row * 19 + col
-        move_array = np.zeros((num_planes, go_board.board_size, go_board.board_size))
-        for row in range(0, go_board.board_size):
-            for col in range(0, go_board.board_size):
-                pos = (row, col)
-                if go_board.board.get(pos) == color:
-                    if go_board.go_strings[pos].liberties.size() == 1:
-                        move_array[0, row, col] = 1
-                    elif go_board.go_strings[pos].liberties.size() == 2:
-                        move_array[1, row, col] = 1
-                    elif go_board.go_strings[pos].liberties.size() >= 3:
-                        move_array[2, row, col] = 1
-                if go_board.board.get(pos) == enemy_color:
-                    if go_board.go_strings[pos].liberties.size() == 1:
-                        move_array[3, row, col] = 1
-                    elif go_board.go_strings[pos].liberties.size() == 2:
-                        move_array[4, row, col] = 1
-                    elif go_board.go_strings[pos].liberties.size() >= 3:
-                        move_array[5, row, col] = 1
-                if go_board.is_simple_ko(color, pos):
-                    move_array[6, row, col] = 1
-        return move_array, label
+        move_array = np.zeros((num_planes, go_board.board_size, go_board.board_size), dtype=FEATURE_DTYPE)
+        self.fill_features(color, go_board, move_array)
+        return move_array, row * 19 + col
+
+    def fill_features(self, color, go_board, out):
+        fill_seven_planes(color, go_board, out)
 
 
 class ThreePlaneProcessor(GoDataProcessor):
@@ -68,11 +106,12 @@ class ThreePlaneProcessor(GoDataProcessor):
     stone positions of each color and one for ko.
     '''
 
-    def __init__(self, data_directory='data', num_planes=3, consolidate=True, use_generator=False):
+    def __init__(self, data_directory='data', num_planes=3, consolidate=True, use_generator=False, augment=None):
         super(ThreePlaneProcessor, self).__init__(data_directory=data_directory,
                                                   num_planes=num_planes,
                                                   consolidate=consolidate,
-                                                  use_generator=use_generator)
+                                                  use_generator=use_generator,
+                                                  augment=augment)
 
     def feature_and_label(self, color, move, go_board, num_planes):
         '''
@@ -88,19 +127,16 @@ class ThreePlaneProcessor(GoDataProcessor):
         2: ko
         '''
         row, col = move
-        enemy_color = go_board.other_color(color)
-        label = row * 19 + col
-        move_array = np.zeros((num_planes, go_board.board_size, go_board.board_size))
-        for row in range(0, go_board.board_size):
-            for col in range(0, go_board.board_size):
-                pos = (row, col)
-                if go_board.board.get(pos) == color:
-                    move_array[0, row, col] = 1
-                if go_board.board.get(pos) == enemy_color:
-                    move_array[1, row, col] = 1
-                if go_board.is_simple_ko(color, pos):
-                    move_array[2, row, col] = 1
-        return move_array, label
+        move_array = np.zeros((num_planes, go_board.board_size, go_board.board_size), dtype=FEATURE_DTYPE)
+        self.fill_features(color, go_board, move_array)
+        return move_array, row * 19 + col
+
+    def fill_features(self, color, go_board, out):
+        ours, theirs, _ = stone_and_liberty_grids(color, go_board)
+        out[0][ours] = 1
+        out[1][theirs] = 1
+        for pos in simple_ko_points(color, go_board):
+            out[(2,) + pos] = 1
 
 
 class SevenPlaneFileProcessor(GoFileProcessor):
@@ -128,43 +164,11 @@ class SevenPlaneFileProcessor(GoFileProcessor):
         4: their stones with 2 liberty
         5: their stones with 3 or more liberties
         6: simple ko
+
+        Each record is 'GO', the label as little-endian 16 bit integer, two zero bytes and the seven planes
+        packed eight points to a byte, most significant bit first, written in a single call.
         '''
         row, col = move
-        enemy_color = go_board.other_color(color)
-        data_file.write('GO')
-        label = row * 19 + col
-        data_file.write(chr(label % 256))
-        data_file.write(chr(label // 256))
-        data_file.write(chr(0))
-        data_file.write(chr(0))
-        thisbyte = 0
-        thisbitpos = 0
-        for plane in range(0, 7):
-            for row in range(0, go_board.board_size):
-                for col in range(0, go_board.board_size):
-                    thisbit = 0
-                    pos = (row, col)
-                    if go_board.board.get(pos) == color:
-                        if plane == 0 and go_board.go_strings[pos].liberties.size() == 1:
-                            thisbit = 1
-                        elif plane == 1 and go_board.go_strings[pos].liberties.size() == 2:
-                            thisbit = 1
-                        elif plane == 2 and go_board.go_strings[pos].liberties.size() >= 3:
-                            thisbit = 1
-                    if go_board.board.get(pos) == enemy_color:
-                        if plane == 3 and go_board.go_strings[pos].liberties.size() == 1:
-                            thisbit = 1
-                        elif plane == 4 and go_board.go_strings[pos].liberties.size() == 2:
-                            thisbit = 1
-                        elif plane == 5 and go_board.go_strings[pos].liberties.size() >= 3:
-                            thisbit = 1
-                    if plane == 6 and go_board.is_simple_ko(color, pos):
-                            thisbit = 1
-                    thisbyte = thisbyte + (thisbit << (7 - thisbitpos))
-                    thisbitpos = thisbitpos + 1
-                    if thisbitpos == 8:
-                        data_file.write(chr(thisbyte))
-                        thisbitpos = 0
-                        thisbyte = 0
-        if thisbitpos != 0:
-            data_file.write(chr(thisbyte))
+        planes = np.zeros((7, go_board.board_size, go_board.board_size), dtype=FEATURE_DTYPE)
+        fill_seven_planes(color, go_board, planes)
+        data_file.write(struct.pack('<2sHH', b'GO', row * 19 + col, 0) + np.packbits(planes).tobytes())
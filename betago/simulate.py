@@ -1,3 +1,9 @@
+import numpy as np
+from six.moves import range
+
+from .dataloader.symmetry import NUM_SYMMETRIES, inverse_symmetry, transform_planes
+
+
 def simulate_game(board, black_bot, white_bot):
     """Simulate a game between two bots."""
     move_num = 1
@@ -17,3 +23,54 @@ def simulate_game(board, black_bot, white_bot):
         moves.append(next_move)
         move_num += 1
         whose_turn = 'b' if whose_turn == 'w' else 'w'
+
+
+def _predict(model, X, board_size, symmetric=False):
+    """Predictions of model for the feature planes X, one flat row of board points per position.
+
+    With symmetric, every position is fed in all eight rotations and reflections in one predict
+    call, and the predictions, turned back to the original orientation, are averaged, like
+    KerasBot does with symmetric=True.
+    """
+    X = X.astype('float32')
+    if not symmetric:
+        return model.predict(X).reshape(len(X), board_size * board_size)
+    X = np.concatenate([transform_planes(X, symmetry) for symmetry in range(NUM_SYMMETRIES)])
+    preds = model.predict(X).reshape(NUM_SYMMETRIES, -1, board_size, board_size)
+    pred = np.mean([transform_planes(pred, inverse_symmetry(symmetry)) for symmetry, pred in enumerate(preds)],
+                   axis=0)
+    return pred.reshape(-1, board_size * board_size)
+
+
+def simulate_games(batch, black_model, white_model, num_planes=7, max_moves=500, symmetric=False):
+    """Simulate one game per board of a BoardBatch, with a single predict call per model and turn.
+
+    Every game plays the legal move its model rates highest and passes once no legal move is left.
+    A game ends after two passes in a row or max_moves moves. With symmetric, the predictions are
+    averaged over all eight board symmetries, see _predict. Returns the list of moves of every
+    game, with None for a pass.
+    """
+    num_points = batch.board_size * batch.board_size
+    moves = [[] for _ in range(batch.num_games)]
+    active = np.ones(batch.num_games, dtype=bool)
+    whose_turn = 'b'
+    for _ in range(max_moves):
+        if not active.any():
+            break
+        model = black_model if whose_turn == 'b' else white_model
+        games = np.flatnonzero(active)
+        X = batch.features(whose_turn, num_planes, games)
+        legal = batch.legal_moves_masks(whose_turn, games).reshape(-1, num_points)
+        pred = np.where(legal, _predict(model, X, batch.board_size, symmetric), -np.inf)
+        best = pred.argmax(axis=1)
+
+        next_moves = [None] * batch.num_games
+        for index, idx, has_move in zip(games, best, legal.any(axis=1)):
+            if has_move:
+                next_moves[index] = divmod(int(idx), batch.board_size)
+            moves[index].append(next_moves[index])
+            if moves[index][-2:] == [None, None]:
+                active[index] = False
+        batch.apply_moves(whose_turn, next_moves)
+        whose_turn = 'b' if whose_turn == 'w' else 'w'
+    return moves
@@ -71,7 +71,8 @@ class TrainingRun(object):
         model.add(Dense(19 * 19))
         model.add(Activation('softmax'))
         opt = Adadelta(clipnorm=0.25)
-        model.compile(loss='categorical_crossentropy', optimizer=opt, metrics=['accuracy'])
+        # Labels are move indices, so train on them directly instead of one-hot vectors.
+        model.compile(loss='sparse_categorical_crossentropy', optimizer=opt, metrics=['accuracy'])
         training_run = cls(filename, model, 0, 0, index.num_chunks)
         training_run.save()
         return training_run
@@ -0,0 +1,117 @@
+'''
+Replay the same randomly generated games on every board implementation and report moves applied per second,
+how many legality checks per second each board answers on the final positions, and how much memory and time
+it takes to deepcopy those positions.
+'''
+from __future__ import print_function
+import argparse
+import copy
+import functools
+import random
+import time
+
+from betago.dataloader.arrayboard import ArrayGoBoard
+from betago.dataloader.goboard import GoBoard, GoString
+from six.moves import range
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+BOARDS = [
+    ('GoBoard', GoBoard),
+    ('GoBoard/sequence', functools.partial(GoBoard, string_class=GoString)),
+    ('ArrayGoBoard', ArrayGoBoard),
+]
+
+
+def random_game(rng, num_moves, board_size=19):
+    '''Generate a sequence of legal (color, move) pairs by playing random moves.'''
+    board = ArrayGoBoard(board_size)
+    empty = [(row, col) for row in range(board_size) for col in range(board_size)]
+    moves = []
+    color = 'b'
+    for _ in range(num_moves):
+        rng.shuffle(empty)
+        for pos in empty:
+            if pos not in board.board and board.is_move_legal(color, pos):
+                board.apply_move(color, pos)
+                moves.append((color, pos))
+                break
+        color = 'w' if color == 'b' else 'b'
+    return moves
+
+
+def replay(new_board, games):
+    start = time.time()
+    num_moves = 0
+    for moves in games:
+        board = new_board(19)
+        for color, move in moves:
+            board.apply_move(color, move)
+        num_moves += len(moves)
+    return num_moves / (time.time() - start)
+
+
+def final_positions(new_board, games, board_size=19):
+    boards = []
+    for moves in games:
+        board = new_board(board_size)
+        for color, move in moves:
+            board.apply_move(color, move)
+        boards.append(board)
+    return boards
+
+
+def check_legality(new_board, games, board_size=19):
+    boards = final_positions(new_board, games, board_size)
+    start = time.time()
+    num_checks = 0
+    for board in boards:
+        for row in range(board_size):
+            for col in range(board_size):
+                for color in ('b', 'w'):
+                    board.is_move_legal(color, (row, col))
+        num_checks += 2 * board_size * board_size
+    return num_checks / (time.time() - start)
+
+
+def measure_copies(new_board, games):
+    '''
+    Kilobytes allocated per deepcopy of a final position, or None without tracemalloc, and deepcopies per
+    second.
+    '''
+    boards = final_positions(new_board, games)
+    kilobytes = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        copies = [copy.deepcopy(board) for board in boards]
+        allocated, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del copies
+        kilobytes = allocated / 1024.0 / len(boards)
+    start = time.time()
+    for board in boards:
+        copy.deepcopy(board)
+    return kilobytes, len(boards) / (time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', '-g', type=int, default=20)
+    parser.add_argument('--moves', '-m', type=int, default=250)
+    parser.add_argument('--seed', '-s', type=int, default=1337)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    games = [random_game(rng, args.moves) for _ in range(args.games)]
+    for name, new_board in BOARDS:
+        kilobytes, copies = measure_copies(new_board, games)
+        memory = '    n/a' if kilobytes is None else '%7.1f' % kilobytes
+        print('%-16s %10.0f moves/s %10.0f legality checks/s %s KB/copy %7.0f copies/s' % (
+            name, replay(new_board, games), check_legality(new_board, games), memory, copies))
+
+
+if __name__ == '__main__':
+    main()
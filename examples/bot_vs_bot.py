@@ -4,12 +4,13 @@ import yaml
 from keras.models import model_from_yaml
 from betago import scoring
 from betago.dataloader import goboard
+from betago.dataloader.boardbatch import BoardBatch
 from betago.model import KerasBot
 from betago.processor import SevenPlaneProcessor
-from betago.simulate import simulate_game
+from betago.simulate import simulate_game, simulate_games
 
 
-def load_keras_bot(bot_name):
+def load_keras_bot(bot_name, symmetric=False):
     model_file = 'model_zoo/' + bot_name + '_bot.yml'
     weight_file = 'model_zoo/' + bot_name + '_weights.hd5'
     with open(model_file, 'r') as f:
@@ -19,7 +20,28 @@ def load_keras_bot(bot_name):
         model.compile(loss='categorical_crossentropy', optimizer='adadelta', metrics=['accuracy'])
         model.load_weights(weight_file)
     processor = SevenPlaneProcessor()
-    return KerasBot(model=model, processor=processor)
+    return KerasBot(model=model, processor=processor, symmetric=symmetric)
+
+
+def area_score(board, komi):
+    '''Chinese area score of black and white, without removing dead stones.'''
+    status = scoring.evaluate_territory(board)
+    black_area = status.num_black_territory + status.num_black_stones
+    white_area = status.num_white_territory + status.num_white_stones
+    return black_area, white_area + komi
+
+
+def play_batch(black_bot, white_bot, args):
+    print("Simulating %d games of %s vs %s..." % (args.games, args.black_bot_name, args.white_bot_name))
+    batch = BoardBatch(args.games)
+    simulate_games(batch, black_bot.model, white_bot.model, num_planes=black_bot.num_planes,
+                   symmetric=args.symmetric)
+    black_wins = 0
+    for board in batch.boards:
+        black_score, white_score = area_score(board, args.komi)
+        if black_score > white_score:
+            black_wins += 1
+    print("Black won %d of %d games" % (black_wins, args.games))
 
 
 def main():
@@ -27,10 +49,21 @@ def main():
     parser.add_argument('black_bot_name')
     parser.add_argument('white_bot_name')
     parser.add_argument('--komi', '-k', type=float, default=5.5)
+    parser.add_argument('--games', '-g', type=int, default=1,
+                        help='Number of games to play. More than one game are played as a batch, '
+                             'with one prediction per bot and move for all games.')
+    parser.add_argument('--symmetric', '-s', action='store_true',
+                        help='Average the predictions of each bot over all eight board symmetries.')
     args = parser.parse_args()
 
-    black_bot = load_keras_bot(args.black_bot_name)
-    white_bot = load_keras_bot(args.white_bot_name)
+    black_bot = load_keras_bot(args.black_bot_name, args.symmetric)
+    white_bot = load_keras_bot(args.white_bot_name, args.symmetric)
+    if args.games > 1:
+        play_batch(black_bot, white_bot, args)
+        return
+    # Enforce positional superko, so the bots can't cycle forever.
+    black_bot.set_board(goboard.GoBoard(superko=True, feature_planes=True))
+    white_bot.set_board(goboard.GoBoard(superko=True, feature_planes=True))
 
     print("Simulating %s vs %s..." % (args.black_bot_name, args.white_bot_name))
     board = goboard.GoBoard()
@@ -39,12 +72,9 @@ def main():
     print(goboard.to_string(board))
     # Does not remove dead stones.
     print("\nScore (Chinese rules):")
-    status = scoring.evaluate_territory(board)
-    black_area = status.num_black_territory + status.num_black_stones
-    white_area = status.num_white_territory + status.num_white_stones
-    white_score = white_area + args.komi
+    black_area, white_score = area_score(board, args.komi)
     print("Black %d" % black_area)
-    print("White %d + %.1f = %.1f" % (white_area, args.komi, white_score))
+    print("White %d + %.1f = %.1f" % (white_score - args.komi, args.komi, white_score))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,135 @@
+import gzip
+import io
+import os
+import tarfile
+import unittest
+
+from betago.corpora.archive import ArchiveIndex, SafetyError, TarballSGFLocator, find_archives, tarball_iterator
+
+from ..helpers import TempDirTestCase, write_archive
+
+GAMES = [
+    '(;GM[1]SZ[19];B[dd];W[pp];B[dp];W[pd])',
+    '(;GM[1]SZ[19]HA[2]AB[dd][pp];W[dp];B[pd];W[qq])',
+    '(;GM[1]SZ[19];B[qq])',
+]
+
+
+class ArchiveIndexTest(TempDirTestCase):
+    def setUp(self):
+        super(ArchiveIndexTest, self).setUp()
+        self.archive_path = os.path.join(self.data_dir, 'kgs.tar.gz')
+        write_archive(self.archive_path, GAMES)
+
+    def assert_reads_games(self, archive_index):
+        self.assertEqual(['kgs', 'kgs/0.sgf', 'kgs/1.sgf', 'kgs/2.sgf'], archive_index.names)
+        for num, game in enumerate(GAMES):
+            self.assertEqual(game.encode('ascii'), archive_index.read('kgs/%d.sgf' % num))
+
+    def test_compressed_archive(self):
+        self.assertIsNone(ArchiveIndex.uncompressed_path(self.archive_path))
+        self.assert_reads_games(ArchiveIndex.build(self.archive_path))
+
+    def test_uncompressed_copy(self):
+        archive_index = ArchiveIndex.build(self.archive_path)
+        archive_index.uncompress()
+        tar_path = os.path.join(self.data_dir, 'kgs.tar')
+        self.assertEqual(tar_path, ArchiveIndex.uncompressed_path(self.archive_path))
+        with gzip.open(self.archive_path) as compressed, open(tar_path, 'rb') as copy:
+            self.assertEqual(compressed.read(), copy.read())
+        self.assert_reads_games(archive_index)
+        # Offsets are the same whether indexed from the copy or the compressed stream.
+        self.assertEqual(archive_index.offsets, ArchiveIndex.build(self.archive_path).offsets)
+
+    def test_uncompressed_archive(self):
+        tar_path = os.path.join(self.data_dir, 'plain.tar')
+        write_archive(tar_path, GAMES, mode='w')
+        self.assertEqual(tar_path, ArchiveIndex.uncompressed_path(tar_path))
+        self.assert_reads_games(ArchiveIndex.build(tar_path))
+
+    def test_other_compressions(self):
+        for suffix, mode in (('.tgz', 'w:gz'), ('.tar.bz2', 'w:bz2')):
+            archive_path = os.path.join(self.data_dir, 'other' + suffix)
+            write_archive(archive_path, GAMES, mode=mode)
+            self.assertIsNone(ArchiveIndex.uncompressed_path(archive_path))
+            archive_index = ArchiveIndex.build(archive_path)
+            self.assert_reads_games(archive_index)
+            archive_index.uncompress()
+            tar_path = os.path.join(self.data_dir, 'other.tar')
+            self.assertEqual(tar_path, ArchiveIndex.uncompressed_path(archive_path))
+            self.assert_reads_games(ArchiveIndex.build(archive_path))
+            os.remove(tar_path)
+
+    def test_find_archives_skips_copies(self):
+        write_archive(os.path.join(self.data_dir, 'other.tgz'), GAMES)
+        write_archive(os.path.join(self.data_dir, 'plain.tar'), GAMES, mode='w')
+        expected = [os.path.join(self.data_dir, name) for name in ('kgs.tar.gz', 'other.tgz', 'plain.tar')]
+        self.assertEqual(expected, list(find_archives(self.data_dir)))
+        for archive_path in expected:
+            ArchiveIndex.build(archive_path).uncompress()
+        self.assertEqual(['kgs.tar', 'kgs.tar.gz', 'other.tar', 'other.tgz', 'plain.tar'],
+                         sorted(name for name in os.listdir(self.data_dir) if 'tar' in name or 'tgz' in name))
+        self.assertEqual(expected, list(find_archives(self.data_dir)))
+
+    def test_read_members_seeks_forward(self):
+        archive_index = ArchiveIndex.build(self.archive_path)
+        positions = []
+        with archive_index.open() as data_file:
+            seek = data_file.seek
+            data_file.seek = lambda offset: positions.append(offset) or seek(offset)
+            contents = archive_index.read_members(['kgs/2.sgf', 'kgs/0.sgf', 'kgs/1.sgf'], data_file)
+        self.assertEqual(sorted(positions), positions)
+        self.assertEqual(dict(('kgs/%d.sgf' % num, game.encode('ascii')) for num, game in enumerate(GAMES)), contents)
+        self.assertFalse(archive_index.random_access)
+        archive_index.uncompress()
+        self.assertTrue(archive_index.random_access)
+
+    def test_load_stores_index(self):
+        self.assertFalse(os.path.exists(ArchiveIndex.index_path(self.archive_path)))
+        built = ArchiveIndex.load(self.archive_path)
+        self.assertTrue(os.path.exists(ArchiveIndex.index_path(self.archive_path)))
+        loaded = ArchiveIndex.load(self.archive_path)
+        self.assertEqual(built.names, loaded.names)
+        self.assertEqual(built.offsets, loaded.offsets)
+        self.assertEqual(built.sizes, loaded.sizes)
+
+    def test_tarball_locator(self):
+        locator = TarballSGFLocator(self.archive_path, 'kgs/1.sgf')
+        self.assertEqual(GAMES[1].encode('ascii'), locator.contents())
+
+
+class TarballIteratorTest(TempDirTestCase):
+    def test_yields_games_in_archive_order(self):
+        archive_path = os.path.join(self.data_dir, 'kgs.tar.gz')
+        names = ['kgs/2.sgf', 'kgs/0.sgf', 'kgs/README', 'kgs/1.sgf']
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            for name, content in zip(names, [b'(;B[aa])', b'(;B[bb])', b'not a game', b'(;B[cc])']):
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        with tarball_iterator(archive_path) as tarball:
+            sgfs = list(tarball)
+        self.assertEqual(['kgs/2.sgf', 'kgs/0.sgf', 'kgs/1.sgf'], [sgf.locator.game_file for sgf in sgfs])
+        self.assertEqual([b'(;B[aa])', b'(;B[bb])', b'(;B[cc])'], [sgf.contents for sgf in sgfs])
+        self.assertEqual([archive_path] * 3, [sgf.locator.physical_file for sgf in sgfs])
+
+    def test_reads_uncompressed_copy(self):
+        archive_path = os.path.join(self.data_dir, 'kgs.tar.gz')
+        write_archive(archive_path, GAMES)
+        ArchiveIndex.build(archive_path).uncompress()
+        with tarball_iterator(archive_path) as tarball:
+            self.assertEqual([game.encode('ascii') for game in GAMES], [sgf.contents for sgf in tarball])
+
+    def test_rejects_unsafe_names(self):
+        archive_path = os.path.join(self.data_dir, 'evil.tar.gz')
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            info = tarfile.TarInfo('../evil.sgf')
+            info.size = 0
+            archive.addfile(info, io.BytesIO())
+        with self.assertRaises(SafetyError):
+            with tarball_iterator(archive_path) as tarball:
+                list(tarball)
+
+
+if __name__ == '__main__':
+    unittest.main()
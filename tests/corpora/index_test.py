@@ -0,0 +1,124 @@
+import os
+import unittest
+
+from six import StringIO
+
+from betago.corpora.archive import tarball_iterator
+from betago.corpora import index as index_module
+from betago.corpora.index import CorpusIndex, _sequence, build_index, count_moves, load_index, store_index
+from betago.gosgf import Sgf_game
+
+from ..helpers import TempDirTestCase, write_archive
+from .archive_test import GAMES
+
+
+def all_examples(corpus_index):
+    '''(physical file, game file, position, color, move) of every example, in index order.'''
+    examples = []
+    for physical_file in corpus_index.physical_files:
+        with tarball_iterator(physical_file) as tarball:
+            for sgf in sorted(tarball, key=lambda sgf: sgf.locator.game_file):
+                moves = [item.get_move() for item in Sgf_game.from_string(sgf.contents).get_main_sequence()]
+                moves = [(color, move) for color, move in moves if color is not None and move is not None]
+                for position, (color, move) in enumerate(moves):
+                    examples.append((physical_file, sgf.locator.game_file, position, color, move))
+    return examples
+
+
+class CountMovesTest(unittest.TestCase):
+    def assert_counts_like_parser(self, sgf_contents):
+        expected = len(_sequence(Sgf_game.from_string(sgf_contents)))
+        self.assertEqual(expected, count_moves(sgf_contents))
+
+    def test_matches_parser(self):
+        for game in GAMES:
+            self.assert_counts_like_parser(game.encode('ascii'))
+            self.assertEqual(count_moves(game.encode('ascii')), count_moves(game))
+
+    def test_passes_and_setup(self):
+        self.assert_counts_like_parser(b'(;GM[1]SZ[19]AB[dd]AW[pp];B[];W[tt];B[cc];C[no move])')
+        self.assertEqual(1, count_moves(b'(;GM[1]SZ[19];B[];W[tt];B[cc])'))
+
+    def test_variations_and_escapes(self):
+        sgf_contents = (b'garbage (;GM[1]SZ[19]C[a comment with \\] and (parens)];B[cc]\n'
+                        b'(;W[dd];B[ee](;W[ff])(;W[gg];B[hh]))(;W[ii]))')
+        self.assertEqual(4, count_moves(sgf_contents))
+        self.assert_counts_like_parser(sgf_contents)
+
+    def test_black_and_white_in_one_node(self):
+        self.assert_counts_like_parser(b'(;GM[1]SZ[19];W[aa]B[bb];B[cc])')
+
+    def test_moves_inside_values(self):
+        self.assert_counts_like_parser(b'(;GM[1]SZ[19];B[aa];C[try ;W[ee\\] next];W[bb])')
+        self.assert_counts_like_parser(b'(;GM[1]SZ[19]AB[cc][dd]C[;B[aa\\]];W[ee]LB[ff:;B][gg:x])')
+
+    def test_moves_after_other_properties(self):
+        self.assert_counts_like_parser(b'(;GM[1]SZ[19];C[setup]B[dd];AB[aa]W[cc];CR[ab]W[]BL[30])')
+        self.assert_counts_like_parser(b'(;GM[1]SZ[9]B[ee];B[tt];W[ii]B[];C[x]W[aa]W[bb])')
+
+    def test_invalid_games_count_zero(self):
+        for sgf_contents in (b'(;GM[1]SZ[19];B[aa];W[zz])', b'(;GM[1]SZ[x];B[aa])', b'(;GM[1]SZ[30];B[aa])',
+                             b'(;GM[1]CA[no-such-charset];B[aa])', b'(;GM[1];B[aa];W[bb]', b'(;GM[1];B[aa]W)',
+                             b'(;GM[1];B[aa](;W[zz])(;W[bb]))', b'no game here'):
+            self.assertRaises(ValueError, lambda: _sequence(Sgf_game.from_string(sgf_contents)))
+            self.assertEqual(0, count_moves(sgf_contents))
+
+
+class CorpusIndexTest(TempDirTestCase):
+    def setUp(self):
+        super(CorpusIndexTest, self).setUp()
+        write_archive(os.path.join(self.data_dir, 'kgs-a.tar.gz'), GAMES)
+        write_archive(os.path.join(self.data_dir, 'kgs-b.tar.gz'), list(reversed(GAMES)))
+
+    def assert_chunks_match(self, corpus_index, num_examples=16):
+        examples = all_examples(corpus_index)
+        starts = [example[:3] for example in examples]
+        self.assertEqual(num_examples, len(examples))
+        for chunk, boundary in enumerate(corpus_index.boundaries):
+            start = starts.index((boundary.locator.physical_file, boundary.locator.game_file, boundary.position))
+            expected = [example[3:] for example in examples[start:start + corpus_index.chunk_size]]
+            self.assertEqual(expected, [(color, move) for _, color, move in corpus_index.get_chunk(chunk)])
+
+    def test_chunks(self):
+        corpus_index = build_index(self.data_dir, 3)
+        self.assertEqual(6, corpus_index.num_chunks)
+        self.assert_chunks_match(corpus_index)
+
+    def test_parallel_build(self):
+        serial = build_index(self.data_dir, 3, num_workers=1)
+        parallel = build_index(self.data_dir, 3, num_workers=2)
+        self.assertEqual(serial.serialize(), parallel.serialize())
+
+    def test_chunks_with_uncompressed_copies(self):
+        corpus_index = build_index(self.data_dir, 3, num_workers=2, uncompress=True)
+        for physical_file in corpus_index.physical_files:
+            self.assertTrue(os.path.isfile(physical_file[:-len('.gz')]))
+        self.assertEqual(build_index(self.data_dir, 3).serialize(), corpus_index.serialize())
+        self.assert_chunks_match(corpus_index)
+
+    def test_games_out_of_archive_order(self):
+        write_archive(os.path.join(self.data_dir, 'kgs-c.tar.gz'), GAMES, numbers=[2, 0, 1])
+        self.addCleanup(setattr, index_module, '_READ_BATCH_SIZE', index_module._READ_BATCH_SIZE)
+        index_module._READ_BATCH_SIZE = 2
+        self.assert_chunks_match(build_index(self.data_dir, 3), num_examples=24)
+
+    def test_chunk_starts_mid_game(self):
+        corpus_index = build_index(self.data_dir, 3)
+        boundary = corpus_index.boundaries[1]
+        self.assertEqual('kgs/0.sgf', boundary.locator.game_file)
+        self.assertEqual(3, boundary.position)
+        board, color, move = next(corpus_index.get_chunk(1))
+        self.assertEqual('w', color)
+        self.assertEqual(3, len(board.board))
+
+    def test_store_and_load(self):
+        corpus_index = build_index(self.data_dir, 3)
+        stored = StringIO()
+        store_index(corpus_index, stored)
+        loaded = load_index(StringIO(stored.getvalue()))
+        self.assertIsInstance(loaded, CorpusIndex)
+        self.assert_chunks_match(loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import random
+import unittest
+
+from betago.dataloader.arrayboard import ArrayGoBoard
+from betago.dataloader.goboard import GoBoard
+from six.moves import range
+
+
+def play_random_game(boards, num_moves, seed, board_size=9):
+    rng = random.Random(seed)
+    reference = boards[0]
+    color = 'b'
+    for _ in range(num_moves):
+        empty = [(r, c) for r in range(board_size) for c in range(board_size)
+                 if (r, c) not in reference.board]
+        rng.shuffle(empty)
+        for pos in empty:
+            if reference.is_move_legal(color, pos):
+                for board in boards:
+                    board.apply_move(color, pos)
+                break
+        color = 'w' if color == 'b' else 'b'
+
+
+class ArrayGoBoardTest(unittest.TestCase):
+    def test_is_move_legal(self):
+        board = ArrayGoBoard()
+        board.apply_move('b', (4, 4))
+
+        self.assertTrue(board.is_move_legal('b', (3, 3)))
+        self.assertTrue(board.is_move_legal('w', (3, 3)))
+        self.assertFalse(board.is_move_legal('w', (4, 4)))
+        self.assertFalse(board.is_move_legal('w', (19, 4)))
+
+    def test_is_move_legal_suicide(self):
+        board = ArrayGoBoard()
+        board.apply_move('b', (4, 4))
+        board.apply_move('b', (5, 5))
+        board.apply_move('b', (6, 4))
+        board.apply_move('b', (5, 3))
+
+        self.assertFalse(board.is_move_legal('w', (5, 4)))
+        self.assertTrue(board.is_move_legal('b', (5, 4)))
+
+    def test_is_move_legal_ko(self):
+        board = ArrayGoBoard()
+        board.apply_move('b', (4, 4))
+        board.apply_move('b', (5, 5))
+        board.apply_move('b', (6, 4))
+        board.apply_move('b', (5, 3))
+        board.apply_move('w', (4, 5))
+        board.apply_move('w', (5, 6))
+        board.apply_move('w', (6, 5))
+        self.assertTrue(board.is_move_legal('w', (5, 4)))
+        # White captures.
+        board.apply_move('w', (5, 4))
+
+        self.assertNotIn((5, 5), board.board)
+        self.assertTrue(board.is_simple_ko('b', (5, 5)))
+        self.assertFalse(board.is_move_legal('b', (5, 5)))
+        self.assertTrue(board.is_move_legal('w', (5, 5)))
+
+    def test_go_strings(self):
+        board = ArrayGoBoard(5)
+        for move in [(0, 0), (0, 1), (1, 1)]:
+            board.apply_move('b', move)
+
+        group = board.go_strings[0, 0]
+        self.assertIs(group, board.go_strings[1, 1])
+        self.assertEqual(3, group.get_num_stones())
+        self.assertEqual(4, group.liberties.size())
+        self.assertIsNone(board.go_strings.get((2, 2)))
+        self.assertEqual('b', board.board[0, 1])
+        self.assertEqual(3, len(board.board))
+
+    def test_apply_move_occupied(self):
+        board = ArrayGoBoard()
+        board.apply_move('b', (4, 4))
+
+        self.assertRaises(ValueError, board.apply_move, 'w', (4, 4))
+
+    def test_legal_moves_mask(self):
+        for seed in range(5):
+            board = ArrayGoBoard(9)
+            play_random_game([board], 100, seed)
+            for color in ('b', 'w'):
+                mask = board.legal_moves_mask(color)
+                for row in range(9):
+                    for col in range(9):
+                        self.assertEqual(board.is_move_legal(color, (row, col)), mask[row, col])
+
+    def test_matches_go_board(self):
+        for seed in range(5):
+            board, array_board = GoBoard(9), ArrayGoBoard(9)
+            play_random_game([array_board, board], 120, seed)
+
+            self.assertEqual(dict(board.board), dict(array_board.board))
+            for pos in board.board:
+                self.assertEqual(board.go_strings[pos].get_num_liberties(),
+                                 array_board.go_strings[pos].get_num_liberties())
+                self.assertEqual(board.go_strings[pos].get_num_stones(),
+                                 array_board.go_strings[pos].get_num_stones())
+            for pos in [(r, c) for r in range(9) for c in range(9)]:
+                for color in ('b', 'w'):
+                    self.assertEqual(board.is_simple_ko(color, pos), array_board.is_simple_ko(color, pos))
+            for color in ('b', 'w'):
+                self.assertTrue((board.legal_moves_mask(color) == array_board.legal_moves_mask(color)).all())
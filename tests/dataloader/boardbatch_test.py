@@ -0,0 +1,75 @@
+import random
+import unittest
+
+import numpy as np
+from six.moves import range
+
+from betago.dataloader.boardbatch import BoardBatch
+from betago.processor import SevenPlaneProcessor, ThreePlaneProcessor
+
+
+def play_random_moves(batch, num_moves, seed):
+    rng = random.Random(seed)
+    color = 'b'
+    for _ in range(num_moves):
+        moves = []
+        for mask in batch.legal_moves_masks(color):
+            legal = list(zip(*np.nonzero(mask)))
+            moves.append(tuple(int(x) for x in rng.choice(legal)) if legal else None)
+        batch.apply_moves(color, moves)
+        color = 'w' if color == 'b' else 'b'
+
+
+class BoardBatchTest(unittest.TestCase):
+    def test_apply_moves(self):
+        batch = BoardBatch(3, 5)
+        batch.apply_moves('b', [(0, 0), None, (2, 2)])
+        batch.apply_moves(['w', 'b', 'w'], [(0, 1), (1, 1), None])
+
+        self.assertEqual((3, 5, 5), batch.stones.shape)
+        self.assertEqual(2, batch.stones[0].astype(bool).sum())
+        self.assertEqual('w', batch.boards[0].board[0, 1])
+        self.assertEqual('b', batch.boards[1].board[1, 1])
+        self.assertEqual(1, batch.stones[1, 1, 1])
+        self.assertEqual(4, batch.liberty_counts()[2, 2, 2])
+
+    def test_capture_updates_stones(self):
+        batch = BoardBatch(1, 5)
+        batch.apply_moves('b', [(0, 0)])
+        batch.apply_moves('w', [(0, 1)])
+        batch.apply_moves('b', [(2, 2)])
+        batch.apply_moves('w', [(1, 0)])
+
+        self.assertEqual(0, batch.stones[0, 0, 0])
+        self.assertEqual(3, batch.stones[0].astype(bool).sum())
+
+    def test_features_match_processors(self):
+        batch = BoardBatch(4, 19)
+        play_random_moves(batch, 150, seed=3)
+        for num_planes, processor in ((7, SevenPlaneProcessor()), (3, ThreePlaneProcessor())):
+            for color in ('b', 'w'):
+                features = batch.features(color, num_planes)
+                self.assertEqual((4, num_planes, 19, 19), features.shape)
+                for board, board_features in zip(batch.boards, features):
+                    expected, _ = processor.feature_and_label(color, (0, 0), board, num_planes)
+                    self.assertTrue((expected == board_features).all())
+
+    def test_boards_share_stacked_points(self):
+        batch = BoardBatch(2, 5)
+        batch.boards[1].apply_move('w', (3, 4))
+        self.assertEqual(2, batch.stones[1, 3, 4])
+        self.assertEqual(0, batch.stones[0].astype(bool).sum())
+
+    def test_features_of_selected_games(self):
+        batch = BoardBatch(4, 19)
+        play_random_moves(batch, 60, seed=5)
+        games = [3, 1]
+        colors = ['b', 'w', 'b', 'w']
+        for num_planes in (3, 7):
+            expected = batch.features(colors, num_planes)[games]
+            np.testing.assert_array_equal(expected, batch.features(colors, num_planes, games))
+        np.testing.assert_array_equal(batch.legal_moves_masks(colors)[games], batch.legal_moves_masks(colors, games))
+        self.assertEqual((0, 7, 19, 19), batch.features('b', games=[]).shape)
+
+    def test_features_unsupported_planes(self):
+        self.assertRaises(ValueError, BoardBatch(1).features, 'b', 5)
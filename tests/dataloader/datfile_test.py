@@ -0,0 +1,93 @@
+import os
+import random
+
+import numpy as np
+from six.moves import range
+
+from betago.dataloader.datfile import DatFile, parse_header
+from betago.dataloader.goboard import GoBoard
+from betago.processor import SevenPlaneFileProcessor, SevenPlaneProcessor
+
+from ..helpers import TempDirTestCase
+
+
+def write_dat_file(path, num_records, seed):
+    '''Write a .dat file of random positions, returning their features and labels.'''
+    processor = SevenPlaneFileProcessor()
+    feature_processor = SevenPlaneProcessor()
+    rng = random.Random(seed)
+    board = GoBoard()
+    color = 'b'
+    features, labels = [], []
+    with open(path, 'wb') as data_file:
+        processor.write_file_header(data_file, num_records, 7, 19, 1)
+        for _ in range(num_records):
+            move = next(pos for pos in iter(lambda: (rng.randrange(19), rng.randrange(19)), None)
+                        if board.is_move_legal(color, pos))
+            processor.store_results(data_file, color, move, board)
+            X, y = feature_processor.feature_and_label(color, move, board, 7)
+            features.append(X)
+            labels.append(y)
+            board.apply_move(color, move)
+            color = board.other_color(color)
+        data_file.write(b'END')
+    return features, labels
+
+
+class DatFileTest(TempDirTestCase):
+    def setUp(self):
+        super(DatFileTest, self).setUp()
+        self.path = os.path.join(self.data_dir, 'kgsgo_train')
+        self.features, self.labels = write_dat_file(self.path, 60, seed=3)
+
+    def test_parse_header(self):
+        header = parse_header(open(self.path, 'rb').read(1024))
+        self.assertEqual(60, header['n'])
+        self.assertEqual(7, header['num_planes'])
+        self.assertEqual(19, header['imagewidth'])
+        self.assertRaises(ValueError, parse_header, b'mlv1-n=3')
+
+    def test_batch(self):
+        dat_file = DatFile(self.path)
+        self.assertEqual(60, len(dat_file))
+        X, y = dat_file.batch([5, 0, 59])
+        self.assertEqual((3, 7, 19, 19), X.shape)
+        self.assertEqual(np.uint8, X.dtype)
+        self.assertEqual(np.int16, y.dtype)
+        for row, index in enumerate([5, 0, 59]):
+            self.assertTrue((self.features[index] == X[row]).all())
+            self.assertEqual(self.labels[index], y[row])
+
+    def test_batches_cover_file(self):
+        dat_file = DatFile(self.path)
+        labels = []
+        for X, y in dat_file.batches(batch_size=16, seed=2):
+            self.assertLessEqual(X.shape[0], 16)
+            labels.extend(y)
+        self.assertEqual(sorted(self.labels), sorted(labels))
+
+        X, y = next(dat_file.generate(batch_size=8, sparse_labels=True, shuffle=False))
+        self.assertEqual(np.float32, X.dtype)
+        self.assertEqual(self.labels[:8], list(y))
+
+    def test_consolidate_games(self):
+        processor = SevenPlaneFileProcessor(data_directory=self.data_dir)
+        os.rename(self.path, os.path.join(self.data_dir, 'kgs-atrain'))
+        processor.write_manifest(os.path.join(self.data_dir, 'kgs-atrain'), 60)
+        # The second file has no manifest, so its record count comes from its header.
+        features, labels = write_dat_file(os.path.join(self.data_dir, 'kgs-btrain'), 25, seed=4)
+        samples = [('kgs-a.tar.gz', 0), ('kgs-b.tar.gz', 0), ('kgs-a.tar.gz', 1)]
+
+        processor.consolidate_games('train', samples)
+
+        self.assertEqual(85, processor.read_num_records(self.path))
+        with open(self.path, 'rb') as consolidated:
+            self.assertEqual(b'END', consolidated.read()[-3:])
+        dat_file = DatFile(self.path)
+        self.assertEqual(85, len(dat_file))
+        X, y = dat_file.batch(range(85))
+        # Files are consolidated in no particular order.
+        if y[0] != self.labels[0] or not (X[0] == self.features[0]).all():
+            X, y = np.roll(X, -25, axis=0), np.roll(y, -25)
+        self.assertEqual(self.labels + labels, list(y))
+        self.assertTrue((np.array(self.features + features) == X).all())
@@ -1,6 +1,9 @@
+import copy
+import random
 import unittest
 
-from betago.dataloader.goboard import GoBoard, from_string, to_string
+from betago.dataloader.goboard import (BitsetGoString, BoardBitset, FeaturePlanes, GoBoard, GoString, from_string,
+                                      to_string)
 
 
 class GoBoardTest(unittest.TestCase):
@@ -46,6 +49,40 @@ class GoBoardTest(unittest.TestCase):
         self.assertTrue(board.is_move_legal('w', (5, 4)))
         self.assertTrue(board.is_move_legal('b', (5, 4)))
 
+    def test_is_move_legal_suicide_of_string(self):
+        board = from_string('''
+            .bw..
+            bbw..
+            ww...
+            .....
+            .....
+        ''')
+
+        # Filling the last liberty of our own string is suicide...
+        self.assertTrue(board.is_move_suicide('b', (4, 0)))
+        self.assertFalse(board.is_move_legal('b', (4, 0)))
+        # ...but for white it captures.
+        self.assertFalse(board.is_move_suicide('w', (4, 0)))
+        self.assertTrue(board.is_move_legal('w', (4, 0)))
+
+    def test_is_move_suicide_matches_applied_move(self):
+        board = from_string('''
+            .b.wb
+            b.bw.
+            .bww.
+            bw.wb
+            .b.b.
+        ''')
+        for row in range(5):
+            for col in range(5):
+                if (row, col) in board.board:
+                    continue
+                for color in ('b', 'w'):
+                    temp_board = copy.deepcopy(board)
+                    temp_board.apply_move(color, (row, col))
+                    expected = temp_board.go_strings[row, col].get_num_liberties() == 0
+                    self.assertEqual(expected, board.is_move_suicide(color, (row, col)))
+
     def test_is_move_legal_should_not_mutate_board(self):
         board = GoBoard()
         board.apply_move('b', (4, 4))
@@ -78,6 +115,253 @@ class GoBoardTest(unittest.TestCase):
         # But white can.
         self.assertTrue(board.is_move_legal('w', (5, 5)))
 
+    def test_legal_moves_mask(self):
+        board = from_string('''
+            .b.wb
+            b.bw.
+            .bww.
+            bw.wb
+            .b.b.
+        ''')
+        for color in ('b', 'w'):
+            mask = board.legal_moves_mask(color)
+            self.assertEqual((5, 5), mask.shape)
+            for row in range(5):
+                for col in range(5):
+                    self.assertEqual(board.is_move_legal(color, (row, col)), mask[row, col])
+
+    def test_legal_moves_mask_ko(self):
+        board = GoBoard()
+        board.apply_move('b', (4, 4))
+        board.apply_move('b', (5, 5))
+        board.apply_move('b', (6, 4))
+        board.apply_move('b', (5, 3))
+        board.apply_move('w', (4, 5))
+        board.apply_move('w', (5, 6))
+        board.apply_move('w', (6, 5))
+        board.apply_move('w', (5, 4))
+
+        self.assertFalse(board.legal_moves_mask('b')[5, 5])
+        self.assertTrue(board.legal_moves_mask('w')[5, 5])
+        self.assertEqual(19 * 19 - 7, board.legal_moves_mask('w').sum())
+        self.assertEqual(19 * 19 - 8, board.legal_moves_mask('b').sum())
+
+    def test_board_hash_is_order_independent(self):
+        board = GoBoard()
+        self.assertEqual(0, board.board_hash)
+        board.apply_move('b', (3, 3))
+        board.apply_move('w', (15, 15))
+        other_board = GoBoard()
+        other_board.apply_move('w', (15, 15))
+        other_board.apply_move('b', (3, 3))
+
+        self.assertNotEqual(0, board.board_hash)
+        self.assertEqual(board.board_hash, other_board.board_hash)
+
+    def test_board_hash_after_capture(self):
+        board = from_string('''
+            .b...
+            bw...
+            .b...
+            .....
+            .....
+        ''')
+        expected = from_string('''
+            .b...
+            b.b..
+            .b...
+            .....
+            .....
+        ''')
+
+        self.assertEqual(board.hash_after_move('b', (3, 2)), expected.board_hash)
+        board.apply_move('b', (3, 2))
+        self.assertEqual(expected.board_hash, board.board_hash)
+
+    def test_positional_superko(self):
+        board = GoBoard(superko=True)
+        # Set up a ko.
+        board.apply_move('b', (4, 4))
+        board.apply_move('b', (5, 5))
+        board.apply_move('b', (6, 4))
+        board.apply_move('b', (5, 3))
+        board.apply_move('w', (4, 5))
+        board.apply_move('w', (5, 6))
+        board.apply_move('w', (6, 5))
+        # White captures.
+        board.apply_move('w', (5, 4))
+
+        # Retaking would repeat the position before white's capture.
+        self.assertTrue(board.is_positional_superko('b', (5, 5)))
+        self.assertFalse(board.is_positional_superko('b', (0, 0)))
+        self.assertFalse(board.legal_moves_mask('b')[5, 5])
+        # Without a history, only simple ko is checked.
+        self.assertFalse(GoBoard().is_positional_superko('b', (5, 5)))
+
+    def test_pop_move_restores_capture(self):
+        board = from_string('''
+            .b...
+            bw...
+            .b...
+            .....
+            .....
+        ''')
+        board_hash = board.board_hash
+
+        board.push_move('b', (3, 2))
+        self.assertNotIn((3, 1), board.board)
+        board.pop_move()
+
+        self.assertEqual(board_hash, board.board_hash)
+        self.assertNotIn((3, 2), board.board)
+        self.assertEqual('w', board.board[3, 1])
+        self.assertEqual(1, board.go_strings[3, 1].get_num_liberties())
+        self.assertEqual(3, board.go_strings[2, 1].get_num_liberties())
+        self.assertEqual(2, board.go_strings[3, 0].get_num_liberties())
+
+    def test_rejected_push_move_is_not_journaled(self):
+        board = GoBoard(5)
+        board.push_move('b', (2, 2))
+        board.push_move('w', (2, 3))
+        with self.assertRaises(ValueError):
+            board.push_move('b', (2, 2))
+        board.pop_move()
+        self.assertEqual({(2, 2): 'b'}, dict(board.board))
+        board.pop_move()
+        self.assertEqual({}, dict(board.board))
+
+    def test_push_and_pop_random_game(self):
+        def state(board):
+            return (dict(board.board),
+                    dict((pos, sorted(board.go_strings[pos].liberties.stones)) for pos in board.board),
+                    board.ko_last_move, board.ko_last_move_num_captured, board.board_hash,
+                    set(board.position_history))
+
+        for string_class in (GoString, BitsetGoString):
+            rng = random.Random(42)
+            board = GoBoard(7, superko=True, string_class=string_class)
+            color = 'b'
+            states = []
+            for _ in range(120):
+                mask = board.legal_moves_mask(color)
+                moves = [(row, col) for row in range(7) for col in range(7) if mask[row, col]]
+                if not moves:
+                    break
+                states.append(state(board))
+                board.push_move(color, rng.choice(moves))
+                color = board.other_color(color)
+            while states:
+                board.pop_move()
+                self.assertEqual(states.pop(), state(board))
+
+    def test_feature_planes_follow_moves(self):
+        def assert_planes_match(board):
+            stones = board.feature_planes.stones
+            liberties = board.feature_planes.liberties
+            for row in range(7):
+                for col in range(7):
+                    color = board.board.get((row, col))
+                    if color is None:
+                        self.assertEqual((0, 0), (stones[row, col], liberties[row, col]))
+                    else:
+                        self.assertEqual(FeaturePlanes.COLOR_CODES[color], stones[row, col])
+                        self.assertEqual(board.go_strings[row, col].get_num_liberties(), liberties[row, col])
+
+        for string_class in (GoString, BitsetGoString):
+            rng = random.Random(7)
+            board = GoBoard(7, string_class=string_class, feature_planes=True)
+            color = 'b'
+            for _ in range(150):
+                mask = board.legal_moves_mask(color)
+                moves = [(row, col) for row in range(7) for col in range(7) if mask[row, col]]
+                if not moves:
+                    break
+                board.push_move(color, rng.choice(moves))
+                assert_planes_match(board)
+                color = board.other_color(color)
+            while board.move_journal:
+                board.pop_move()
+                assert_planes_match(board)
+            self.assertIsNone(GoBoard(7).feature_planes)
+
+    def test_board_bitset(self):
+        bitset = BoardBitset(5)
+        bitset.insert((1, 2))
+        bitset.insert((0, 4))
+        bitset.insert((1, 2))
+        self.assertEqual(2, bitset.size())
+        self.assertTrue(bitset.exists((1, 2)))
+        self.assertFalse(bitset.exists((2, 1)))
+        self.assertEqual([(0, 4), (1, 2)], bitset.stones)
+
+        other = BoardBitset(5)
+        other.insert((4, 4))
+        other.insert((0, 4))
+        bitset.update(other)
+        self.assertEqual([(0, 4), (1, 2), (4, 4)], bitset.stones)
+        self.assertEqual(3, bitset.size())
+        bitset.erase((0, 4))
+        bitset.erase((0, 4))
+        self.assertEqual(2, bitset.size())
+        self.assertEqual((4, 4), bitset[1])
+
+    def test_bitset_strings_match_sequences(self):
+        rng = random.Random(7)
+        board = GoBoard(9, string_class=GoString)
+        bitset_board = GoBoard(9, string_class=BitsetGoString)
+        color = 'b'
+        for _ in range(150):
+            mask = board.legal_moves_mask(color)
+            moves = [(row, col) for row in range(9) for col in range(9) if mask[row, col]]
+            if not moves:
+                break
+            move = rng.choice(moves)
+            board.apply_move(color, move)
+            bitset_board.apply_move(color, move)
+            color = board.other_color(color)
+
+        self.assertEqual(board.board, bitset_board.board)
+        self.assertEqual(board.board_hash, bitset_board.board_hash)
+        for pos in board.board:
+            go_string, bitset_string = board.go_strings[pos], bitset_board.go_strings[pos]
+            self.assertIsInstance(bitset_string, BitsetGoString)
+            self.assertEqual(sorted(go_string.stones.stones), bitset_string.stones.stones)
+            self.assertEqual(sorted(go_string.liberties.stones), bitset_string.liberties.stones)
+
+    def test_fold_go_strings_keeps_larger_root(self):
+        board = GoBoard(7)
+        for move in [(0, 0), (1, 0), (2, 0), (0, 2)]:
+            board.apply_move('b', move)
+        board.apply_move('b', (0, 1))
+
+        group = board.go_strings[0, 2]
+        self.assertEqual(5, group.get_num_stones())
+        self.assertEqual(5, group.get_num_liberties())
+        self.assertEqual([(0, 0)], list(board.root_strings))
+        for pos in [(0, 0), (1, 0), (2, 0), (0, 1), (0, 2)]:
+            self.assertIs(group, board.go_strings[pos])
+            self.assertEqual((0, 0), board.find_root(pos))
+        self.assertEqual(5, len(board.go_strings))
+        self.assertNotIn((0, 3), board.go_strings)
+
+    def test_deepcopy_is_independent(self):
+        for string_class in (GoString, BitsetGoString):
+            board = GoBoard(5, string_class=string_class)
+            for move in [(0, 0), (0, 1), (2, 2)]:
+                board.apply_move('b', move)
+            board.push_move('w', (1, 0))
+
+            board_copy = copy.deepcopy(board)
+            board_copy.pop_move()
+
+            self.assertFalse(hasattr(board, '__dict__'))
+            self.assertIs(board_copy, board_copy.go_strings.go_board)
+            self.assertIs(board_copy.go_strings[0, 0], board_copy.go_strings[0, 1])
+            self.assertEqual(2, board.go_strings[0, 0].get_num_liberties())
+            self.assertEqual(3, board_copy.go_strings[0, 0].get_num_liberties())
+            self.assertIn((1, 0), board.board)
+            self.assertNotIn((1, 0), board_copy.board)
+
     def test_from_string(self):
         board = from_string('''
             .b...
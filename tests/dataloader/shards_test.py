@@ -0,0 +1,87 @@
+import json
+import os
+import unittest
+
+import numpy as np
+
+from betago.dataloader.shards import ShardedDataset, ShardWriter
+from betago.processor import SevenPlaneProcessor
+
+from ..helpers import TempDirTestCase
+
+
+def random_examples(num_examples, seed):
+    rng = np.random.RandomState(seed)
+    features = rng.randint(0, 2, size=(num_examples, 7, 19, 19)).astype(np.uint8)
+    labels = rng.randint(0, 19 * 19, size=num_examples).astype(np.int16)
+    return features, labels
+
+
+class ShardsTest(TempDirTestCase):
+    def setUp(self):
+        super(ShardsTest, self).setUp()
+        self.features, self.labels = random_examples(25, seed=1)
+
+    def write(self, block_sizes, shard_size=10):
+        writer = ShardWriter(self.data_dir, 'test', (7, 19, 19), shard_size=shard_size)
+        start = 0
+        for size in block_sizes:
+            writer.append(self.features[start:start + size], self.labels[start:start + size])
+            start += size
+        return writer.close()
+
+    def test_shard_boundaries(self):
+        manifest_path = self.write([7, 12, 6])
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertEqual(25, manifest['num_examples'])
+        self.assertEqual([0, 10, 20], [shard['offset'] for shard in manifest['shards']])
+        self.assertEqual([10, 10, 5], [shard['num_examples'] for shard in manifest['shards']])
+        last_shard = np.load(os.path.join(self.data_dir, manifest['shards'][-1]['features']))
+        np.testing.assert_array_equal(self.features[20:], last_shard)
+
+    def test_indexing(self):
+        dataset = ShardedDataset(self.write([25]))
+        self.assertEqual(25, len(dataset))
+        self.assertEqual((25, 7, 19, 19), dataset.features.shape)
+        np.testing.assert_array_equal(self.features[3], dataset.features[3])
+        np.testing.assert_array_equal(self.features[-1], dataset.features[-1])
+        self.assertEqual(self.labels[12], dataset.labels[12])
+        np.testing.assert_array_equal(self.features[8:23:2], dataset.features[8:23:2])
+        indices = np.array([24, 0, 9, 10, 19])
+        np.testing.assert_array_equal(self.features[indices], dataset.features[indices])
+        np.testing.assert_array_equal(self.labels[indices], dataset.labels[indices])
+
+    def test_whole_arrays(self):
+        dataset = ShardedDataset(self.write([4, 21]))
+        np.testing.assert_array_equal(self.features, np.asarray(dataset.features))
+        X = dataset.features.astype('float32')
+        self.assertEqual(np.float32, X.dtype)
+        np.testing.assert_array_equal(self.features, X)
+        np.testing.assert_array_equal(self.labels, np.asarray(dataset.labels))
+
+    def test_generate_visits_every_example_once_per_epoch(self):
+        dataset = ShardedDataset(self.write([25]))
+        generator = dataset.generate(batch_size=8, sparse_labels=True, seed=3)
+        batches = [next(generator) for _ in range(4)]
+        self.assertEqual([8, 8, 8, 1], [len(y) for X, y in batches])
+        self.assertEqual(np.float32, batches[0][0].dtype)
+        labels = np.concatenate([y for X, y in batches])
+        self.assertEqual(sorted(self.labels.tolist()), sorted(labels.tolist()))
+
+    def test_consolidate_games(self):
+        processor = SevenPlaneProcessor(data_directory=self.data_dir)
+        for chunk, (start, stop) in enumerate([(0, 10), (10, 20), (20, 25)]):
+            np.save(os.path.join(self.data_dir, 'KGS-2001-19-100train_features_%d.npy' % chunk),
+                    self.features[start:stop])
+            np.save(os.path.join(self.data_dir, 'KGS-2001-19-100train_labels_%d.npy' % chunk),
+                    self.labels[start:stop])
+        X, y = processor.consolidate_games('train', [('KGS-2001-19-100.tar.gz', 0)])
+        self.assertEqual(25, len(X))
+        np.testing.assert_array_equal(self.features, np.asarray(X))
+        np.testing.assert_array_equal(self.labels, np.asarray(y))
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, '7_plane_train_manifest.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
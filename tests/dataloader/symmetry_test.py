@@ -0,0 +1,65 @@
+import os
+import unittest
+
+import numpy as np
+from six.moves import range
+
+from betago.dataloader.base_processor import DataGenerator
+from betago.dataloader.symmetry import NUM_SYMMETRIES, inverse_symmetry, transform_labels, transform_planes
+
+from ..helpers import TempDirTestCase
+
+
+class SymmetryTest(unittest.TestCase):
+    def test_labels_follow_planes(self):
+        X = np.zeros((19 * 19, 2, 19, 19), dtype=np.uint8)
+        y = np.arange(19 * 19, dtype=np.int16)
+        X[y, 1, y // 19, y % 19] = 1
+        for symmetry in range(NUM_SYMMETRIES):
+            X_sym = transform_planes(X, symmetry)
+            y_sym = transform_labels(y, symmetry)
+            self.assertEqual(np.int16, y_sym.dtype)
+            self.assertEqual(list(range(19 * 19)), sorted(y_sym))
+            self.assertTrue((X_sym[:, 1].reshape(19 * 19, -1).argmax(axis=1) == y_sym).all())
+
+    def test_planes_are_views(self):
+        X = np.arange(2 * 3 * 19 * 19).reshape(2, 3, 19, 19)
+        for symmetry in range(NUM_SYMMETRIES):
+            self.assertTrue(np.shares_memory(X, transform_planes(X, symmetry)))
+
+    def test_symmetries_are_distinct_and_invertible(self):
+        board = np.arange(19 * 19).reshape(19, 19)
+        images = set()
+        for symmetry in range(NUM_SYMMETRIES):
+            transformed = transform_planes(board, symmetry)
+            images.add(transformed.tobytes())
+            restored = transform_planes(transformed, inverse_symmetry(symmetry))
+            self.assertTrue((board == restored).all())
+        self.assertEqual(NUM_SYMMETRIES, len(images))
+        self.assertEqual(15, transform_labels(3, 4))
+
+
+class DataGeneratorAugmentTest(TempDirTestCase):
+    def setUp(self):
+        super(DataGeneratorAugmentTest, self).setUp()
+        X = np.zeros((4, 7, 19, 19), dtype=np.uint8)
+        y = np.array([0, 20, 45, 360], dtype=np.int16)
+        X[np.arange(4), 0, y // 19, y % 19] = 1
+        np.save(os.path.join(self.data_dir, 'kgs-testtrain_features_0.npy'), X)
+        np.save(os.path.join(self.data_dir, 'kgs-testtrain_labels_0.npy'), y)
+
+    def test_augment(self):
+        samples = [('kgs-test.tar.gz', 0)]
+        plain = list(DataGenerator(self.data_dir, samples, sparse_labels=True)._generate(2, 19 * 19))
+        self.assertEqual(2, len(plain))
+        for augment, num_batches in (('all', 16), ('random', 2)):
+            generator = DataGenerator(self.data_dir, samples, sparse_labels=True, augment=augment, seed=1)
+            batches = list(generator._generate(2, 19 * 19))
+            self.assertEqual(num_batches, len(batches))
+            for X, y in batches:
+                self.assertEqual(np.float32, X.dtype)
+                self.assertTrue((X[:, 0].reshape(2, -1).argmax(axis=1) == y).all())
+            self.assertEqual(4 * num_batches // 2, generator.get_num_samples(2))
+
+    def test_unknown_augmentation(self):
+        self.assertRaises(ValueError, DataGenerator, self.data_dir, [], augment='mirror')
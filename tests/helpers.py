@@ -0,0 +1,29 @@
+import io
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+
+def write_archive(path, games, folder='kgs', mode='w:gz', numbers=None):
+    '''
+    Write SGF games to a tar archive laid out like the KGS archives: a folder entry, then one file per game, named
+    after its position in games or its entry in numbers.
+    '''
+    with tarfile.open(path, mode) as archive:
+        info = tarfile.TarInfo(folder)
+        info.type = tarfile.DIRTYPE
+        archive.addfile(info)
+        for num, game in zip(numbers or range(len(games)), games):
+            content = game.encode('ascii')
+            info = tarfile.TarInfo('%s/%d.sgf' % (folder, num))
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+
+
+class TempDirTestCase(unittest.TestCase):
+    '''Test case with a fresh temporary directory in self.data_dir, removed again after every test.'''
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
@@ -1,9 +1,29 @@
 import unittest
 
+import numpy as np
 import six
 
 from betago import model
 from betago.dataloader import goboard
+from betago.processor import ThreePlaneProcessor
+
+
+class FixedPredictionModel(object):
+    def __init__(self, pred):
+        self.pred = pred
+
+    def predict(self, X):
+        return self.pred.reshape((X.shape[0], -1))
+
+
+class StonePlaneModel(object):
+    """Predicts the first feature plane, i.e. follows the position through every symmetry."""
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, X):
+        self.batch_sizes.append(X.shape[0])
+        return X[:, 0].reshape((X.shape[0], -1)) + X[:, 1].reshape((X.shape[0], -1)) * 0.5
 
 
 class ModelTestCase(unittest.TestCase):
@@ -31,3 +51,40 @@ class ModelTestCase(unittest.TestCase):
 
         self.assertEqual((2, 0), model.get_first_valid_move(board, 'b', candidates))
         self.assertEqual((2, 2), model.get_first_valid_move(board, 'w', candidates))
+
+    def test_keras_bot_skips_illegal_predictions(self):
+        pred = np.full(19 * 19, 0.001)
+        # The favourite is occupied, the runner-up is suicide for white.
+        pred[4 * 19 + 4] = 0.5
+        pred[5 * 19 + 4] = 0.3
+        pred[0 * 19 + 0] = 0.1
+        bot = model.KerasBot(FixedPredictionModel(pred), ThreePlaneProcessor(), top_n=3)
+        for move in [(4, 4), (5, 5), (6, 4), (5, 3)]:
+            bot.apply_move('b', move)
+
+        model_moves = list(bot._model_moves('w'))
+        self.assertEqual(3, len(model_moves))
+        self.assertEqual((0, 0), model_moves[0])
+        self.assertNotIn((5, 4), model_moves)
+        self.assertEqual((0, 0), bot.select_move('w'))
+
+    def test_keras_bot_symmetric_ensemble(self):
+        pred = np.zeros(19 * 19)
+        pred[0] = 1
+        bot = model.KerasBot(FixedPredictionModel(np.tile(pred, 8)), ThreePlaneProcessor(), symmetric=True)
+        # Every orientation votes for its own top left corner, i.e. one of the four corners.
+        averaged = bot._predict(np.zeros((3, 19, 19), dtype=np.uint8)).reshape((19, 19))
+        for corner in [(0, 0), (0, 18), (18, 0), (18, 18)]:
+            self.assertAlmostEqual(0.25, averaged[corner])
+        self.assertAlmostEqual(1, averaged.sum())
+
+        stone_model = StonePlaneModel()
+        bot = model.KerasBot(stone_model, ThreePlaneProcessor(), symmetric=True)
+        bot.apply_move('b', (2, 5))
+        bot.apply_move('w', (7, 1))
+        X, _ = ThreePlaneProcessor().feature_and_label('w', (0, 0), bot.go_board, 3)
+        averaged = bot._predict(X).reshape((19, 19))
+        self.assertEqual([8], stone_model.batch_sizes)
+        self.assertEqual(1, averaged[7, 1])
+        self.assertEqual(0.5, averaged[2, 5])
+        self.assertEqual(1.5, averaged.sum())
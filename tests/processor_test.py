@@ -0,0 +1,206 @@
+import functools
+import glob
+import io
+import itertools
+import os
+import random
+import unittest
+
+import numpy as np
+from six.moves import range
+
+from betago.corpora.archive import ArchiveIndex
+from betago.dataloader.arrayboard import ArrayGoBoard
+from betago.dataloader.datfile import DatFile
+from betago.dataloader.encoding import model_input
+from betago.dataloader.goboard import GoBoard, GoString
+from betago.dataloader.shards import ShardedDataset
+from betago.processor import SevenPlaneFileProcessor, SevenPlaneProcessor, ThreePlaneProcessor
+
+from .helpers import TempDirTestCase, write_archive
+
+
+def seven_planes_pointwise(color, go_board):
+    '''Seven feature planes computed point by point, as SevenPlaneProcessor used to.'''
+    enemy_color = go_board.other_color(color)
+    move_array = np.zeros((7, go_board.board_size, go_board.board_size))
+    for row in range(go_board.board_size):
+        for col in range(go_board.board_size):
+            pos = (row, col)
+            for offset, side in ((0, color), (3, enemy_color)):
+                if go_board.board.get(pos) == side:
+                    num_liberties = go_board.go_strings[pos].liberties.size()
+                    move_array[offset + min(num_liberties, 3) - 1, row, col] = 1
+            if go_board.is_simple_ko(color, pos):
+                move_array[6, row, col] = 1
+    return move_array
+
+
+def three_planes_pointwise(color, go_board):
+    '''Three feature planes computed point by point, as ThreePlaneProcessor used to.'''
+    move_array = np.zeros((3, go_board.board_size, go_board.board_size))
+    for row in range(go_board.board_size):
+        for col in range(go_board.board_size):
+            pos = (row, col)
+            if go_board.board.get(pos) == color:
+                move_array[0, row, col] = 1
+            elif go_board.board.get(pos) == go_board.other_color(color):
+                move_array[1, row, col] = 1
+            if go_board.is_simple_ko(color, pos):
+                move_array[2, row, col] = 1
+    return move_array
+
+
+def seven_plane_record_bitwise(color, move, go_board):
+    '''A SevenPlaneFileProcessor record assembled bit by bit, as store_results used to.'''
+    row, col = move
+    label = row * 19 + col
+    record = bytearray(b'GO') + bytearray([label % 256, label // 256, 0, 0])
+    bits = seven_planes_pointwise(color, go_board).astype(int).flatten().tolist()
+    bits += [0] * (-len(bits) % 8)
+    for start in range(0, len(bits), 8):
+        record.append(sum(bit << (7 - pos) for pos, bit in enumerate(bits[start:start + 8])))
+    return bytes(record)
+
+
+TEST_GAMES = [
+    '(;GM[1]SZ[19];B[dd];W[pp];B[dp];W[pd])',
+    '(;GM[1]SZ[19]HA[2]AB[dd][pp];W[dp];B[pd];W[qq])',
+]
+
+
+class PlaneProcessorTest(unittest.TestCase):
+    def assert_matches_pointwise(self, go_board):
+        for processor, num_planes, pointwise in ((SevenPlaneProcessor(), 7, seven_planes_pointwise),
+                                                 (ThreePlaneProcessor(), 3, three_planes_pointwise)):
+            for color in ('b', 'w'):
+                features, label = processor.feature_and_label(color, (3, 4), go_board, num_planes)
+                expected = pointwise(color, go_board)
+                self.assertEqual(np.uint8, features.dtype)
+                self.assertTrue((expected == features).all())
+                self.assertEqual(3 * 19 + 4, label)
+
+    def test_ko_plane(self):
+        board = GoBoard(feature_planes=True)
+        for move in [(4, 4), (5, 5), (6, 4), (5, 3)]:
+            board.apply_move('b', move)
+        for move in [(4, 5), (5, 6), (6, 5), (5, 4)]:
+            board.apply_move('w', move)
+
+        features, _ = SevenPlaneProcessor().feature_and_label('b', (0, 0), board, 7)
+        self.assertEqual(1, features[6, 5, 5])
+        self.assert_matches_pointwise(board)
+
+    def test_matches_pointwise_on_random_games(self):
+        new_boards = [GoBoard, functools.partial(GoBoard, string_class=GoString), ArrayGoBoard,
+                      functools.partial(GoBoard, feature_planes=True)]
+        for seed in range(3):
+            for new_board in new_boards:
+                rng = random.Random(seed)
+                board = new_board()
+                color = 'b'
+                for move_num in range(200):
+                    candidates = [(rng.randrange(19), rng.randrange(19)) for _ in range(20)]
+                    legal = [pos for pos in candidates if board.is_move_legal(color, pos)]
+                    if legal:
+                        board.apply_move(color, legal[0])
+                    if move_num % 40 == 0 or board.ko_last_move_num_captured == 1:
+                        self.assert_matches_pointwise(board)
+                    color = 'w' if color == 'b' else 'b'
+                self.assert_matches_pointwise(board)
+
+    def test_features_for_positions(self):
+        rng = random.Random(5)
+        board = GoBoard(feature_planes=True)
+        positions = []
+        color = 'b'
+        while len(positions) < 30:
+            pos = (rng.randrange(19), rng.randrange(19))
+            if board.is_move_legal(color, pos):
+                positions.append((color, pos))
+                board.apply_move(color, pos)
+                color = board.other_color(color)
+
+        def replay():
+            board = GoBoard(feature_planes=True)
+            for color, pos in positions:
+                yield board
+                board.apply_move(color, pos)
+
+        colors = [color for color, _ in positions]
+        for processor in (SevenPlaneProcessor(), ThreePlaneProcessor()):
+            expected = np.array([processor.feature_and_label(color, pos, board, processor.num_planes)[0]
+                                 for board, (color, pos) in zip(replay(), positions)])
+            out = np.zeros((40, processor.num_planes, 19, 19), dtype=np.uint8)
+            features = processor.features_for_positions(replay(), colors, out=out)
+            self.assertEqual((30, processor.num_planes, 19, 19), features.shape)
+            self.assertEqual(np.uint8, features.dtype)
+            self.assertTrue((expected == features).all())
+
+            boards = list(itertools.islice(replay(), 1))
+            features = processor.features_for_positions(boards, colors[:1], dtype=np.float32)
+            self.assertEqual((1, processor.num_planes, 19, 19), features.shape)
+            self.assertEqual(np.float32, features.dtype)
+
+    def test_model_input(self):
+        X = np.array([[[[0, 1]]], [[[1, 0]]]], dtype=np.uint8)
+        y = np.array([3, 360], dtype=np.int16)
+
+        X_float, y_sparse = model_input(X, y, sparse_labels=True)
+        self.assertEqual(np.float32, X_float.dtype)
+        self.assertTrue((X == X_float).all())
+        self.assertEqual([3, 360], list(y_sparse))
+
+        _, y_one_hot = model_input(X, y)
+        self.assertEqual((2, 361), y_one_hot.shape)
+        self.assertEqual([3, 360], list(y_one_hot.argmax(axis=1)))
+
+    def test_store_results_matches_bitwise_records(self):
+        rng = random.Random(11)
+        board = GoBoard(feature_planes=True)
+        processor = SevenPlaneFileProcessor()
+        color = 'b'
+        for move_num in range(120):
+            candidates = [(rng.randrange(19), rng.randrange(19)) for _ in range(20)]
+            move = next(pos for pos in candidates if board.is_move_legal(color, pos))
+            if move_num % 20 == 0 or board.ko_last_move_num_captured == 1:
+                data_file = io.BytesIO()
+                processor.store_results(data_file, color, move, board)
+                self.assertEqual(6 + 316, len(data_file.getvalue()))
+                self.assertEqual(seven_plane_record_bitwise(color, move, board), data_file.getvalue())
+            board.apply_move(color, move)
+            color = board.other_color(color)
+
+
+class ProcessZipTest(TempDirTestCase):
+    def test_process_zip_writes_partial_chunk(self):
+        write_archive(os.path.join(self.data_dir, 'kgs-test.tar.gz'), TEST_GAMES, folder='kgs-test')
+        processor = SevenPlaneProcessor(data_directory=self.data_dir)
+        processor.process_zip(self.data_dir, 'kgs-test.tar.gz', 'kgs-testtrain', [0, 1])
+        self.assertEqual(1, len(glob.glob(os.path.join(self.data_dir, 'kgs-testtrain_features_*.npy'))))
+        dataset = ShardedDataset(os.path.join(self.data_dir, 'kgs-testtrain_manifest.json'))
+        # The first move of the even game is not an example, handicap games count from the first move.
+        self.assertEqual(6, len(dataset))
+        self.assertEqual((6, 7, 19, 19), dataset.features.shape)
+        self.assertEqual(np.uint8, dataset.features.dtype)
+        self.assertEqual(np.int16, dataset.labels.dtype)
+        self.assertEqual(['kgs-test.tar.gz'], [name for name in os.listdir(self.data_dir) if 'tar' in name])
+
+    def test_sampled_games(self):
+        write_archive(os.path.join(self.data_dir, 'kgs-test.tar.gz'), TEST_GAMES, folder='kgs-test')
+        processor = SevenPlaneProcessor(data_directory=self.data_dir)
+        games = list(processor.sampled_games(self.data_dir, 'kgs-test.tar.gz', [1, 0, 1]))
+        self.assertEqual([TEST_GAMES[0], TEST_GAMES[1], TEST_GAMES[1]], [game.decode('ascii') for game in games])
+        self.assertEqual([], list(processor.sampled_games(self.data_dir, 'kgs-test.tar.gz', [])))
+        # With an uncompressed copy, games are read by seeking through the archive index.
+        ArchiveIndex.load(os.path.join(self.data_dir, 'kgs-test.tar.gz')).uncompress()
+        self.assertEqual(games, list(processor.sampled_games(self.data_dir, 'kgs-test.tar.gz', [1, 0, 1])))
+
+    def test_file_processor_process_zip(self):
+        write_archive(os.path.join(self.data_dir, 'kgs-test.tar.gz'), TEST_GAMES, folder='kgs-test')
+        processor = SevenPlaneFileProcessor(data_directory=self.data_dir)
+        processor.process_zip(self.data_dir, 'kgs-test.tar.gz', 'kgs-testtrain', [0, 1])
+        dat_file = DatFile(os.path.join(self.data_dir, 'kgs-testtrain'))
+        self.assertEqual(6, len(dat_file))
+        self.assertEqual(6, processor.read_num_records(os.path.join(self.data_dir, 'kgs-testtrain')))
+        self.assertEqual((6, 7, 19, 19), dat_file.batch(range(6))[0].shape)
@@ -0,0 +1,60 @@
+import unittest
+
+import numpy as np
+
+from betago.dataloader.boardbatch import BoardBatch
+from betago.dataloader.goboard import GoBoard
+from betago.dataloader.symmetry import NUM_SYMMETRIES, transform_planes
+from betago.simulate import _predict, simulate_games
+
+
+class RandomPredictionModel(object):
+    def __init__(self, seed):
+        self.rng = np.random.RandomState(seed)
+        self.num_calls = 0
+
+    def predict(self, X):
+        self.num_calls += 1
+        return self.rng.rand(X.shape[0], X.shape[2] * X.shape[3])
+
+
+class FixedPredictionModel(object):
+    def __init__(self, pred):
+        self.pred = pred
+        self.batch_sizes = []
+
+    def predict(self, X):
+        self.batch_sizes.append(len(X))
+        return np.tile(self.pred.reshape(1, -1), (len(X), 1))
+
+
+class SimulateGamesTest(unittest.TestCase):
+    def test_simulate_games(self):
+        batch = BoardBatch(5, 7)
+        black_model, white_model = RandomPredictionModel(1), RandomPredictionModel(2)
+        games = simulate_games(batch, black_model, white_model, max_moves=80)
+
+        self.assertEqual(5, len(games))
+        self.assertEqual(80, black_model.num_calls + white_model.num_calls)
+        for game, array_board in zip(games, batch.boards):
+            board = GoBoard(7)
+            color = 'b'
+            for move in game:
+                if move is not None:
+                    self.assertTrue(board.is_move_legal(color, move))
+                    board.apply_move(color, move)
+                color = 'w' if color == 'b' else 'b'
+            self.assertEqual(dict(board.board), dict(array_board.board))
+
+    def test_symmetric_predictions(self):
+        pred = np.random.RandomState(3).rand(7, 7)
+        model = FixedPredictionModel(pred)
+        averaged = _predict(model, np.zeros((2, 7, 7, 7), dtype=np.uint8), 7, symmetric=True)
+        self.assertEqual([2 * NUM_SYMMETRIES], model.batch_sizes)
+        expected = np.mean([transform_planes(pred, symmetry) for symmetry in range(NUM_SYMMETRIES)], axis=0)
+        np.testing.assert_allclose(np.array([expected.ravel()] * 2), averaged)
+
+        batch = BoardBatch(3, 7)
+        black_model, white_model = RandomPredictionModel(1), FixedPredictionModel(pred)
+        simulate_games(batch, black_model, white_model, max_moves=10, symmetric=True)
+        self.assertEqual([3 * NUM_SYMMETRIES] * 5, white_model.batch_sizes)
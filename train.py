@@ -1,5 +1,6 @@
 import argparse
 import importlib
+import itertools
 import multiprocessing
 import os
 import signal
@@ -13,12 +14,13 @@ import six.moves.queue as queue
 from betago.corpora import build_index, find_sgfs, load_index, store_index
 from betago.gosgf import Sgf_game
 from betago.dataloader import goboard
+from betago.dataloader.encoding import FEATURE_DTYPE, LABEL_DTYPE, model_input
 from betago.processor import SevenPlaneProcessor
 from betago.training import TrainingRun
 
 
 def index(args):
-    corpus_index = build_index(args.data, args.chunk_size)
+    corpus_index = build_index(args.data, args.chunk_size, args.workers, args.uncompress)
     store_index(corpus_index, open(args.output, 'w'))
 
 
@@ -67,28 +69,38 @@ def _disable_keyboard_interrupt():
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 
+class _Stopped(Exception):
+    pass
+
+
+def _unless_stopped(examples, stop_q):
+    for example in examples:
+        if not stop_q.empty():
+            raise _Stopped()
+        yield example
+
+
 def _prepare_training_data_single_process(worker_idx, chunk, corpus_index, output_q, stop_q):
     # Make sure ^C gets handled in the main process.
     _disable_keyboard_interrupt()
     processor = SevenPlaneProcessor()
 
-    chunk = corpus_index.get_chunk(chunk)
-    xs, ys = [], []
-    for board, next_color, next_move in chunk:
-        if not stop_q.empty():
-            print("Got stop signal, aborting.")
-            return
-        feature, label = processor.feature_and_label(next_color, next_move, board,
-                                                     processor.num_planes)
-        xs.append(feature)
-        ys.append(label)
-    X = np.array(xs)
-    # one-hot encode the moves
-    nb_classes = 19 * 19
-    Y = np.zeros((len(ys), nb_classes))
-    for i, y in enumerate(ys):
-        Y[i][y] = 1
-    output_q.put((worker_idx, X, Y))
+    # The chunk advances a single board in place, so features are written into one preallocated
+    # array as we go, while the moves are remembered for the labels.
+    examples, colors, moves = itertools.tee(
+        _unless_stopped(corpus_index.get_chunk(chunk), stop_q), 3)
+    X = np.zeros((corpus_index.chunk_size, processor.num_planes, 19, 19), dtype=FEATURE_DTYPE)
+    try:
+        X = processor.features_for_positions(
+            (board for board, _, _ in examples),
+            (next_color for _, next_color, _ in colors),
+            out=X)
+    except _Stopped:
+        print("Got stop signal, aborting.")
+        return
+    # Keep the moves as indices, they are expanded at the model boundary if need be.
+    y = np.array([row * 19 + col for _, _, (row, col) in moves], dtype=LABEL_DTYPE)
+    output_q.put((worker_idx, X, y))
     output_q.close()
 
 
@@ -133,8 +145,8 @@ def prepare_training_data(num_workers, next_chunk, corpus_index, output_q, stop_
             return
         assert len(results) == len(workers)
         results.sort()
-        for _, X, Y in results:
-            output_q.put((X, Y))
+        for _, X, y in results:
+            output_q.put((X, y))
 
 
 def train(args):
@@ -151,17 +163,20 @@ def train(args):
     p = multiprocessing.Process(target=prepare_training_data,
                                 args=(args.workers, run.chunks_completed, corpus_index, q, stop_q))
     p.start()
+    # Runs created before labels were stored as indices train on one-hot vectors.
+    sparse_labels = run.model.loss == 'sparse_categorical_crossentropy'
     try:
         while True:
             print("Waiting for prepared training chunk...")
             wait_start_ts = time.time()
-            X, Y = q.get()
+            X, y = q.get()
             wait_end_ts = time.time()
             print("Idle %.1f seconds" % (wait_end_ts - wait_start_ts,))
             print("Training epoch %d chunk %d/%d..." % (
                 run.epochs_completed + 1,
                 run.chunks_completed + 1,
                 run.num_chunks))
+            X, Y = model_input(X, y, sparse_labels=sparse_labels)
             run.model.fit(X, Y, epochs=1)
             run.complete_chunk()
     finally:
@@ -198,6 +213,10 @@ def main():
                               help='Directory or archive containing SGF files.')
     index_parser.add_argument('--chunk-size', '-c', type=int, default=20000,
                               help='Number of examples per training chunk.')
+    index_parser.add_argument('--workers', '-w', type=int, default=None,
+                              help='Number of processes counting moves, one per CPU by default.')
+    index_parser.add_argument('--uncompress', '-u', action='store_true',
+                              help='Keep an uncompressed copy of every archive for fast random access.')
 
     show_parser = subparsers.add_parser('show', help='Show a summary of an index.')
     show_parser.set_defaults(command='show')